@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
-import os, json, argparse, asyncio, numpy as np, faiss, torch, open_clip
+import os, sys, json, argparse, asyncio, numpy as np, faiss, torch, open_clip
 from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]/"SearchByPhoto"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]/"LuckyPricer"))
 from PIL import Image
 from skimage.color import rgb2lab
 from aiogram import Bot
@@ -8,6 +10,8 @@ from aiogram.types import InputMediaPhoto, InputFile
 from openpyxl import Workbook
 from openpyxl.drawing.image import Image as XLImage
 from dotenv import load_dotenv
+from png_cache import PngCache
+import catalog  # products.sqlite: только нужные артикулы, без разбора всего products.json
 
 PROJ = Path("/srv/luckypack/App")
 load_dotenv(PROJ/".env")  # подхватываем TELEGRAM_BOT_TOKEN и SUPERADMIN_ID из .env
@@ -15,9 +19,10 @@ load_dotenv(PROJ/".env")  # подхватываем TELEGRAM_BOT_TOKEN и SUPER
 DATA = Path("/app/data/photos")
 EMB  = PROJ/"AI/embeddings"
 P_PROD = PROJ/"LuckyPricer/products.json"
+P_DB   = PROJ/"LuckyPricer/products.sqlite"
 P_PIDX = DATA/"photos_index.json"
 OUTDIR = Path("/app/data/PhotoPicks"); OUTDIR.mkdir(parents=True, exist_ok=True)
-TMPPNG = OUTDIR/"_png"; TMPPNG.mkdir(parents=True, exist_ok=True)
+PNG_CACHE = PngCache()  # общий с search_photo.py LRU-кэш PNG (лимит PNG_CACHE_MAX_MB)
 
 MODEL="ViT-B-32"; PRETRAINED="laion2b_s34b_b79k"; DEVICE="cpu"
 W_IMG=float(os.getenv("W_IMG","0.6")); W_TXT=float(os.getenv("W_TXT","0.3")); W_COL=float(os.getenv("W_COLOR","0.1"))
@@ -64,11 +69,18 @@ def build_excel(rows, out_path):
     ws.append(["Фото","Наименование","Артикул","Категория","Цена (коробка)","Спец. цена","Ваш заказ"])
     for r in rows:
         ws.append(["", r["Наименование"], r["Артикул"], r.get("Категория",""), r.get("Цена (коробка)",""), r.get("Спец. цена",""), ""])
+        ready = r.get("_xlsx")
+        if ready and Path(ready).exists():
+            # готовый PNG 90px из image_opt.py — без конвертации
+            img = XLImage(ready); img.width=96; img.height=96
+            ws.add_image(img, f"A{ws.max_row}")
+            continue
         thumb = r.get("_thumb")
         if thumb and Path(thumb).exists():
-            base = Path(thumb).stem; out_png = TMPPNG / f"{base}.png"
             try:
-                Image.open(thumb).convert("RGBA").save(out_png, "PNG")
+                out_png = PNG_CACHE.get_or_render(f"{Path(thumb).stem}.png",
+                                                  lambda dst: Image.open(thumb).convert("RGBA").save(dst, "PNG"), src=Path(thumb))
+                if out_png is None: raise RuntimeError("не удалось сконвертировать превью")
                 img = XLImage(str(out_png)); img.width=96; img.height=96
                 ws.add_image(img, f"A{ws.max_row}")
             except Exception as e:
@@ -77,12 +89,12 @@ def build_excel(rows, out_path):
 
 def search_top(query_path, n=N):
     (fa_img,img_ids,img_lab),(fa_txt,txt_ids) = load_indexes()
-    products = { str(it.get("Артикул","")).strip(): it for it in json.load(open(P_PROD,"r",encoding="utf-8")) }
     pidx = json.load(open(P_PIDX,"r",encoding="utf-8"))
     q_vec, q_lab = encode_image(query_path)
 
     D, I = fa_img.search(q_vec.reshape(1,-1), min(K, fa_img.ntotal))
     cand_ids = img_ids[I[0]]; cand_img_sim = D[0]; txt_pos = { str(code): i for i,code in enumerate(txt_ids.tolist()) }
+    products = catalog.get_many(cand_ids.tolist(), P_DB, P_PROD)  # только шортлист
 
     results=[]
     for sim_i, art, lab in zip(cand_img_sim, cand_ids, img_lab[I[0]]):
@@ -99,6 +111,7 @@ def search_top(query_path, n=N):
 
         rec = pidx.get(art, {})
         prod["_thumb"] = rec.get("thumb",""); prod["_score"] = float(score)
+        prod["_tg"] = rec.get("tg",""); prod["_xlsx"] = rec.get("xlsx","")
         results.append(prod)
 
     results.sort(key=lambda r: r["_score"], reverse=True)
@@ -113,14 +126,17 @@ async def send_to_telegram(results, excel_path, query_path):
         raise SystemExit("Не найден CHAT_ID/SUPERADMIN_ID (ни в .env, ни в окружении)")
     bot = Bot(token=token, parse_mode=None)
 
-    # 1) альбом фото (конвертация webp -> png)
+    # 1) альбом фото (готовый JPEG из image_opt.py; для старых записей — конвертация webp -> png)
     media=[]
     for r in results:
+        ready = r.get("_tg")
+        if ready and Path(ready).exists():
+            media.append(InputMediaPhoto(media=InputFile(ready))); continue
         t = r.get("_thumb")
         if not t or not Path(t).exists(): continue
-        png = TMPPNG / f"{Path(t).stem}.png"
+        key = f"{Path(t).stem}.rgb.png"
         try:
-            Image.open(t).convert("RGB").save(png, "PNG")
+            png = PNG_CACHE.get(key, src=Path(t)) or PNG_CACHE.put(key, lambda dst: Image.open(t).convert("RGB").save(dst, "PNG"))
         except Exception as e:
             print(f"⚠️ PNG для Telegram не создан ({r.get('Артикул')}): {e}"); continue
         media.append(InputMediaPhoto(media=InputFile(str(png))))
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
-import os, json, numpy as np, faiss, torch, open_clip
+import os, sys, json, numpy as np, faiss, torch, open_clip
 from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]/"LuckyPricer"))
+import catalog  # products.sqlite: только нужные артикулы, без разбора всего products.json
 from PIL import Image
 from skimage.color import rgb2lab
 
@@ -8,6 +10,7 @@ PROJ = Path("/srv/luckypack/App")
 DATA = Path("/app/data/photos")
 EMB  = PROJ/"AI/embeddings"
 P_PROD = PROJ/"LuckyPricer/products.json"
+P_DB   = PROJ/"LuckyPricer/products.sqlite"
 P_PIDX = DATA/"photos_index.json"
 
 MODEL="ViT-B-32"; PRETRAINED="laion2b_s34b_b79k"; DEVICE="cpu"
@@ -80,7 +83,7 @@ def main():
     # подготовим словари для быстрого доступа
     # карта: артикул -> позиция в txt_ids (если есть в текстовом индексе)
     txt_pos = { str(code): i for i,code in enumerate(txt_ids.tolist()) }
-    products = { str(it.get("Артикул","")).strip(): it for it in json.load(open(P_PROD,"r",encoding="utf-8")) }
+    products = catalog.get_many(cand_ids.tolist(), P_DB, P_PROD)  # только шортлист
     pidx = json.load(open(P_PIDX,"r",encoding="utf-8"))
 
     # считаем финальный скор для кандидатов
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 # neighbors.py — техническая проверка проводки хендлеров (aiogram v2).
+import asyncio
+from html import escape
+
 from aiogram import types
 from aiogram.dispatcher.filters import Command
 
+from LuckyPricer.catalog import shared as products, fmt_kop  # общий каталог в памяти, перечитывается сам
+
 def register(dp):
     @dp.message_handler(Command("neighbors"))
     async def neighbors_cmd(m: types.Message):
@@ -14,4 +19,10 @@ def register(dp):
         if not (art.isdigit() and len(art) == 13):
             await m.reply("Нужен 13-значный EAN13. Пример: /neighbors 4610027750756")
             return
-        await m.reply(f"Ок, принял артикул {art}. (технический тест)")
+        # перечитка каталога (если файл сменился) — синхронный разбор, уводим его с event loop
+        p = await asyncio.get_event_loop().run_in_executor(None, products().get, art)
+        if p is None:
+            await m.reply(f"Артикул {art} не найден в каталоге.")
+            return
+        price = f"{fmt_kop(p.price)} ₽" if p.price is not None else "—"
+        await m.reply(f"Ок, принял артикул {art}: {escape(p.name)}\nОПТ с НДС: {price}. (технический тест)")
@@ -1,8 +1,16 @@
 """
 yandex_api.py — Скачивание и синхронизация фото с Яндекс.Диска
 
-• Собирает рекурсивно все фото из публичной папки Я.Диск (по ссылке из config.py)
+• Собирает рекурсивно все фото из публичной папки Я.Диск (по ссылке из config.py):
+  обход в ширину, папки и страницы (offset/limit) запрашиваются параллельно, только нужные поля;
+  листинги папок кэшируются (state/photos_listing_cache.json), неизменённые поддеревья не перечитываются
 • Скачивает только новые фото (jpg/jpeg/png), лишние локальные удаляет
+• Скачивание параллельное (YADISK_DL_WORKERS потоков) через общий пул соединений requests.Session,
+  с таймаутами на файл и атомарной записью (*.part → rename); в конце — сводка по пропускной способности
+• Оборванные закачки продолжаются с места обрыва (HTTP Range), файл сверяется с md5/size из листинга
+  перед rename (yandex_disk.fetch_to_file)
+• Все запросы идут через общий yandex_disk.YandexClient: лимит запросов к API, повторы на 429/5xx
+  с учётом Retry-After; сводка счётчиков пишется в лог после листинга и скачивания
 • Все действия и ошибки логируются (logs/photos.log), критичные ошибки — админу через admin_notify
 """
 
@@ -13,63 +21,62 @@ import requests
 import re
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from config import YANDEX_DISK_LINK_PHOTOS, PHOTO_DOWNLOAD_PATH, ALLOWED_PHOTO_EXTENSIONS, LOGS_DIR
 from admin_notify import notify_admin
+from yandex_disk import YandexClient, list_tree, fetch_to_file, stats_line, ChecksumError, HTTP_TIMEOUT, FILE_TIMEOUT
 
 # Логируем в корневую папку logs проекта LuckyPackProject
 PHOTOS_LOG = os.path.join(LOGS_DIR, "photos.log")
 os.makedirs(LOGS_DIR, exist_ok=True)
 os.makedirs(PHOTO_DOWNLOAD_PATH, exist_ok=True)
 
+DL_WORKERS = int(os.getenv("YADISK_DL_WORKERS", "8"))
+
+# Кэш листинга папок с их modified (неизменённые поддеревья не перечитываются)
+LIST_CACHE_PATH = "/srv/luckypack/project/LuckyDownloader/state/photos_listing_cache.json"
+
 def write_photo_log(msg):
     ts = time.strftime('%Y-%m-%d %H:%M:%S')
     with open(PHOTOS_LOG, "a", encoding="utf-8") as logf:
         logf.write(f"[{ts}] {msg}\n")
 
+def make_session(pool_size=DL_WORKERS):
+    """Клиент с пулом соединений на pool_size потоков, общим лимитером и повторами (yandex_disk.YandexClient)."""
+    return YandexClient(pool_size)
+
 def extract_public_key_from_url(url):
     """Извлекает публичный ключ из ссылки Яндекс.Диска"""
     if "/d/" in url:
         return url.split("/d/")[1].split("?")[0]
     return url  # fallback (если уже ключ)
 
-def get_all_files_recursive(public_key, path='/', _silent=False):
-    url = 'https://cloud-api.yandex.net/v1/disk/public/resources'
-    params = {
-        'public_key': public_key,
-        'path': path,
-        'limit': 1000,
-    }
-    try:
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            files = []
-            if '_embedded' in data and 'items' in data['_embedded']:
-                for item in data['_embedded']['items']:
-                    if item['type'] == 'file':
-                        files.append({
-                            'name': item['name'],
-                            'path': item['path'],
-                            'modified': item['modified']
-                        })
-                    elif item['type'] == 'dir':
-                        sub_files = get_all_files_recursive(public_key, item['path'], _silent=True)
-                        files.extend(sub_files)
-            return files
-        else:
-            err = f"Ошибка при получении списка файлов: {response.status_code} — {response.text}"
-            write_photo_log(err)
-            if not _silent:
-                notify_admin(err, module="yandex_api.py")
-            return []
-    except requests.exceptions.RequestException as e:
-        err = f"Сетевая ошибка при получении файлов: {e}"
+def list_files(public_key, path='/', _silent=False, use_cache=True):
+    """
+    Полный список файлов под path (yandex_disk.list_tree): обход в ширину, папки и страницы — параллельно
+    (YADISK_LIST_WORKERS); неизменённые папки берутся из кэша листинга. Возвращает (files, complete):
+    complete=False, если какая-то страница не получена — тогда список неполный и удалять «лишнее» по нему нельзя.
+    """
+    files, complete, failed = list_tree(public_key, path, cache_path=LIST_CACHE_PATH if use_cache else None,
+                                        log=write_photo_log)
+    write_photo_log(stats_line())
+    if failed:
+        err = f"Листинг Я.Диска неполный: ошибок страниц {len(failed)} (первая папка: {failed[0]})"
         write_photo_log(err)
         if not _silent:
             notify_admin(err, module="yandex_api.py")
-        return []
+    return files, complete
 
-def download_files_with_check(files, download_path, public_key, allowed_extensions=None):
+def get_all_files_recursive(public_key, path='/', _silent=False):
+    return list_files(public_key, path, _silent=_silent)[0]
+
+def download_files_with_check(files, download_path, public_key, allowed_extensions=None, prune_extra=True, overwrite=False):
+    """
+    Скачивает files (после дедупликации по имени) в download_path.
+    prune_extra — удалить локальные файлы, которых нет среди files (поведение по умолчанию);
+    overwrite — перекачать даже уже существующие (для дельта-синка по изменённым файлам).
+    Возвращает список имён успешно скачанных файлов.
+    """
     allowed_extensions = allowed_extensions or ALLOWED_PHOTO_EXTENSIONS
     allowed = {e.lower() for e in allowed_extensions}
     os.makedirs(download_path, exist_ok=True)
@@ -120,6 +127,16 @@ def download_files_with_check(files, download_path, public_key, allowed_extensio
                 write_photo_log(f"Skip duplicate by name: {name2}")
                 skipped_name_dups += 1
 
+    # одно и то же имя в разных папках → одна цель: иначе потоки пишут в один <name>.part
+    by_target = {}
+    for f in sorted(planned, key=lambda f: f["path"]):
+        if f["target_name"] in by_target:
+            write_photo_log(f"Skip duplicate by target: {f['path']} (keep {by_target[f['target_name']]['path']})")
+            skipped_name_dups += 1
+        else:
+            by_target[f["target_name"]] = f
+    planned = list(by_target.values())
+
     write_photo_log(f"Planned after name-dedup: {len(planned)}; skipped: {skipped_name_dups}")
 
     # Set of expected normalized filenames from cloud
@@ -131,7 +148,8 @@ def download_files_with_check(files, download_path, public_key, allowed_extensio
             cloud_targets.add(tname)
 
     local_file_names = set(os.listdir(download_path))
-    extra_files = sorted(local_file_names - cloud_targets)
+    keep = cloud_targets | {t + ".part" for t in cloud_targets}  # недокачанные — для докачки
+    extra_files = sorted(local_file_names - keep) if prune_extra else []
     for extra in extra_files:
         try:
             os.remove(os.path.join(download_path, extra))
@@ -146,7 +164,7 @@ def download_files_with_check(files, download_path, public_key, allowed_extensio
     for f in planned:
         tname = f.get("target_name") or f["name"]
         tpath = os.path.join(download_path, tname)
-        if os.path.exists(tpath):
+        if os.path.exists(tpath) and not overwrite:
             skipped_existing += 1
         else:
             to_download.append(f)
@@ -157,42 +175,57 @@ def download_files_with_check(files, download_path, public_key, allowed_extensio
     else:
         write_photo_log(f"New photos to download: {total}")
 
-    url_get = "https://cloud-api.yandex.net/v1/disk/public/resources/download"
-    downloaded = 0
-    for i, f in enumerate(to_download, 1):
-        name = f["name"]; path = f["path"]
-        tname = f.get("target_name") or name
-        tpath = os.path.join(download_path, tname)
-        try:
-            resp = requests.get(url_get, params={"public_key": public_key, "path": path})
-            if resp.status_code == 200:
-                href = resp.json().get("href")
-                try:
-                    with requests.get(href, stream=True) as r:
-                        with open(tpath, "wb") as out:
-                            for chunk in r.iter_content(chunk_size=8192):
-                                out.write(chunk)
-                    downloaded += 1
-                    write_photo_log(f"Downloaded: {tname}")
-                except Exception as e:
-                    err = f"Error writing file {tname}: {e}"
+    downloaded, nbytes, errors, elapsed = 0, 0, 0, 0.0
+    done_names = []
+    if total:
+        session = make_session(min(DL_WORKERS, total))
+        t0 = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(DL_WORKERS, total)) as pool:
+            futures = [pool.submit(_download_one, session, public_key, f, download_path) for f in to_download]
+            for i, fut in enumerate(as_completed(futures), 1):
+                tname, size, err = fut.result()
+                if err:
+                    errors += 1
                     write_photo_log(err)
                     notify_admin(err, module="yandex_api.py")
-                    if os.path.exists(tpath):
-                        os.remove(tpath)
-            else:
-                err = f"Cannot get download link for: {name}"
-                write_photo_log(err)
-                notify_admin(err, module="yandex_api.py")
-        except requests.exceptions.RequestException as e:
-            err = f"Network error while downloading {name}: {e}"
-            write_photo_log(err)
-            notify_admin(err, module="yandex_api.py")
-            if os.path.exists(tpath):
-                os.remove(tpath)
-        write_photo_log(f"Progress: {i} of {total} — {tname}")
+                else:
+                    downloaded += 1; nbytes += size; done_names.append(tname)
+                    write_photo_log(f"Downloaded: {tname}")
+                write_photo_log(f"Progress: {i} of {total} — {tname}")
+        session.close()
+        elapsed = time.monotonic() - t0
 
     write_photo_log(f"New files downloaded: {downloaded}; already existed: {skipped_existing}")
+    if total:
+        mb = nbytes / 1024 / 1024
+        write_photo_log(f"Throughput: {downloaded} files, {mb:.1f} MB in {elapsed:.1f}s — "
+                        f"{downloaded/max(elapsed, 1e-6):.1f} files/s, {mb/max(elapsed, 1e-6):.2f} MB/s; "
+                        f"errors: {errors}; workers: {min(DL_WORKERS, total)}")
+        write_photo_log(stats_line())
+    return done_names
+
+def _download_one(session, public_key, f, download_path):
+    """
+    Скачивает один файл (докачка *.part, проверка md5/size, атомарный rename).
+    Возвращает (имя, байты, ошибка|None); при сетевой ошибке *.part остаётся для следующего запуска.
+    """
+    name = f["name"]; path = f["path"]
+    tname = f.get("target_name") or name
+    tpath = os.path.join(download_path, tname)
+    try:
+        resp = session.api("public/resources/download", {"public_key": public_key, "path": path}, timeout=HTTP_TIMEOUT)
+        if resp.status_code != 200:
+            return tname, 0, f"Cannot get download link for: {name}"
+        href = resp.json().get("href")
+        size = fetch_to_file(session, href, tpath, md5=f.get("md5"), size=f.get("size"),
+                             timeout=HTTP_TIMEOUT, file_timeout=FILE_TIMEOUT)
+        return tname, size, None
+    except ChecksumError as e:
+        return tname, 0, f"Checksum error for {name}: {e}"
+    except (requests.exceptions.RequestException, TimeoutError, ConnectionError) as e:
+        return tname, 0, f"Network error while downloading {name} (will resume): {e}"
+    except Exception as e:
+        return tname, 0, f"Error writing file {tname}: {e}"
 
 def sync_yandex_photos():
     public_key = extract_public_key_from_url(YANDEX_DISK_LINK_PHOTOS)
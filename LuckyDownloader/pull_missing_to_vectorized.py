@@ -3,19 +3,30 @@
 # Назначение: из разницы (Я.Диск ∩ products.json) − vectorized докачать только недостающее
 # Входы: config.py (YANDEX_DISK_LINK_PHOTOS, LOGS_DIR), products.json, /app/data/photos/vectorized
 # Выходы: .webp в vectorized; временные оригиналы в temp (удаляются после конверта)
+# --stream: без temp и без cwebp — байты качаются в память (потоки, общий пул соединений),
+#           декод/кодирование WebP — в пуле процессов (PULL_ENCODE_WORKERS), запись .webp атомарная
 # Логи: LOGS_DIR/photos_pull.log
-import os, sys, re, json, shutil, subprocess, time, pathlib, requests
+import os, sys, re, io, json, shutil, subprocess, time, pathlib
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 # --- конфиг и пути ---
 PR = "/srv/luckypack/project"
-sys.path[:0] = [PR, os.path.join(PR, "LuckyDownloader")]
+sys.path[:0] = [PR, os.path.join(PR, "LuckyDownloader"),
+                os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "LuckyPricer")]
 from config import YANDEX_DISK_LINK_PHOTOS, LOGS_DIR
-from photo_sync.yandex_api import extract_public_key_from_url, get_all_files_recursive
+from photo_sync.yandex_api import extract_public_key_from_url, get_all_files_recursive, make_session
+from yandex_disk import stats_line
+import catalog
 
 VEC_DIR = "/app/data/photos/vectorized"
 TEMP_DIR = "/app/data/photos/temp"
 PJSON   = "/srv/luckypack/project/LuckyPricer/products.json"
+PDB     = "/srv/luckypack/project/LuckyPricer/products.sqlite"
 LOGF    = os.path.join(LOGS_DIR or "/srv/luckypack/logs", "photos_pull.log")
+WEBP_Q  = 90
+DL_WORKERS = int(os.getenv("PULL_DL_WORKERS", "8"))
+ENCODE_WORKERS = int(os.getenv("PULL_ENCODE_WORKERS", str(os.cpu_count() or 2)))
 
 def log(msg):
     ts = time.strftime('%Y-%m-%d %H:%M:%S')
@@ -31,16 +42,9 @@ def stem13(name):
 
 def load_products():
     try:
-        with open(PJSON,"r",encoding="utf-8") as f:
-            data=json.load(f)
-        items = data if isinstance(data,list) else data.get("items",[])
-        s=set()
-        for it in items:
-            a=(it.get("Артикул") or "").strip()
-            if is_ean13(a): s.add(a)
-        return s
+        return {a for a in catalog.articles(PDB, PJSON) if is_ean13(a)}
     except Exception as e:
-        log(f"ERR read products.json: {e}")
+        log(f"ERR read products catalog: {e}")
         return set()
 
 def list_vectorized():
@@ -66,6 +70,7 @@ def list_cloud_eans():
                 eans[e]=it  # первая подходящая
     return eans  # dict ean->filemeta
 
+@lru_cache(maxsize=1)
 def have_cwebp():
     try:
         subprocess.run(["cwebp","-version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
@@ -77,21 +82,20 @@ def convert_to_webp(src_path, dst_path):
     os.makedirs(os.path.dirname(dst_path), exist_ok=True)
     if have_cwebp():
         # cwebp качество 90, без экзотики
-        res = subprocess.run(["cwebp", "-q", "90", src_path, "-o", dst_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        res = subprocess.run(["cwebp", "-q", str(WEBP_Q), src_path, "-o", dst_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         return res.returncode==0
     # Fallback: Pillow
     try:
         from PIL import Image
         with Image.open(src_path) as im:
-            im.save(dst_path, "WEBP", quality=90, method=6)
+            im.save(dst_path, "WEBP", quality=WEBP_Q, method=6)
         return True
     except Exception as e:
         log(f"ERR convert Pillow: {e}")
         return False
 
-def download_one(public_key, path, dst_file):
-    url="https://cloud-api.yandex.net/v1/disk/public/resources/download"
-    r=requests.get(url, params={"public_key": public_key, "path": path}, timeout=30)
+def download_one(session, public_key, path, dst_file):
+    r=session.api("public/resources/download", {"public_key": public_key, "path": path}, timeout=30)
     if r.status_code!=200:
         log(f"ERR get href {path}: {r.status_code}")
         return False
@@ -99,15 +103,98 @@ def download_one(public_key, path, dst_file):
     if not href:
         log(f"ERR empty href for {path}")
         return False
-    with requests.get(href, stream=True, timeout=60) as resp:
+    with session.get(href, stream=True, timeout=60) as resp:
         resp.raise_for_status()
         os.makedirs(os.path.dirname(dst_file), exist_ok=True)
         with open(dst_file,"wb") as out:
             for chunk in resp.iter_content(8192): out.write(chunk)
     return True
 
+def fetch_bytes(session, public_key, path):
+    """Скачивает файл целиком в память; (bytes | None, ошибка | None)."""
+    try:
+        r=session.api("public/resources/download", {"public_key": public_key, "path": path}, timeout=30)
+        if r.status_code!=200:
+            return None, f"get href {path}: {r.status_code}"
+        href=r.json().get("href")
+        if not href:
+            return None, f"empty href for {path}"
+        resp=session.get(href, timeout=60)
+        resp.raise_for_status()
+        return resp.content, None
+    except Exception as e:
+        return None, f"download {path}: {e}"
+
+def encode_webp_bytes(raw):
+    """Воркер пула процессов: байты оригинала -> байты WebP (те же параметры, что у convert_to_webp)."""
+    from PIL import Image
+    with Image.open(io.BytesIO(raw)) as im:
+        buf = io.BytesIO()
+        im.save(buf, "WEBP", quality=WEBP_Q, method=6)
+        return buf.getvalue()
+
+def write_atomic(dst, data):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, dst)
+
+def pull_streaming(public_key, todo, cloud_map):
+    """Скачивание в память (потоки) -> кодирование WebP (процессы) -> атомарная запись; без temp и cwebp."""
+    todo = [e for e in sorted(todo) if not os.path.exists(os.path.join(VEC_DIR, f"{e}.webp"))]
+    ok=0; fail=0; nbytes=0; t0=time.monotonic()
+    if not todo:
+        return ok, fail
+    encodes = {}
+
+    def drain(max_pending):
+        # пишем готовые WebP; держим в памяти не больше max_pending оригиналов в очереди на кодирование
+        nonlocal ok, fail
+        while len(encodes) > max_pending:
+            done, _ = wait(encodes, return_when=FIRST_COMPLETED)
+            for fut in done:
+                ean = encodes.pop(fut)
+                try:
+                    write_atomic(os.path.join(VEC_DIR, f"{ean}.webp"), fut.result())
+                    ok += 1
+                    log(f"OK {ok+fail}/{len(todo)}: {ean} -> vectorized")
+                except Exception as e:
+                    log(f"ERR convert {ean}: {e}"); fail += 1
+
+    session = make_session(DL_WORKERS)
+    with ProcessPoolExecutor(max_workers=ENCODE_WORKERS) as enc:
+        enc.submit(int).result()  # поднимаем процессы до старта потоков (fork при живых потоках небезопасен)
+        with ThreadPoolExecutor(max_workers=DL_WORKERS) as dl:
+            queue = iter(todo); downloads = {}
+            def refill():
+                # скользящее окно закачек: в памяти не больше 2×DL_WORKERS оригиналов
+                while len(downloads) < 2 * DL_WORKERS:
+                    ean = next(queue, None)
+                    if ean is None: return
+                    downloads[dl.submit(fetch_bytes, session, public_key, cloud_map[ean]["path"])] = ean
+            refill()
+            while downloads:
+                done, _ = wait(downloads, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    ean = downloads.pop(fut)
+                    raw, err = fut.result()
+                    if err:
+                        log(f"ERR {ean}: {err}"); fail += 1; continue
+                    nbytes += len(raw)
+                    encodes[enc.submit(encode_webp_bytes, raw)] = ean
+                    drain(4 * ENCODE_WORKERS)
+                refill()
+        drain(0)
+    session.close()
+    dt = time.monotonic() - t0
+    log(f"STREAM: {ok} файлов, {nbytes/1024/1024:.1f} МБ оригиналов за {dt:.1f} с ({ok/max(dt,1e-6):.1f} файл/с)")
+    log(stats_line())
+    return ok, fail
+
 def main():
     do = ("--do" in sys.argv)
+    stream = ("--stream" in sys.argv)
     products = load_products()
     vec = list_vectorized()
     cloud_map = list_cloud_eans()
@@ -130,9 +217,15 @@ def main():
         return 0
 
     link=(os.getenv("YANDEX_DISK_LINK_PHOTOS") or YANDEX_DISK_LINK_PHOTOS or "").strip()
-    public_# key not needed; pass link as-is
+    public_key = link  # ключ не нужен; API принимает ссылку как есть
+
+    if stream:
+        ok, fail = pull_streaming(public_key, todo, cloud_map)
+        log(f"DONE: ok={ok}, fail={fail}")
+        return 0 if fail==0 else 2
 
     ok=0; fail=0
+    session = make_session(1)
     for i,ean in enumerate(sorted(todo),1):
         meta = cloud_map.get(ean)
         path = meta["path"]
@@ -144,7 +237,7 @@ def main():
             if os.path.exists(dst):
                 log(f"Skip exists: {dst}")
                 continue
-            if not download_one(public_key, path, tmp):
+            if not download_one(session, public_key, path, tmp):
                 fail += 1; continue
             if not convert_to_webp(tmp, dst):
                 fail += 1; continue
@@ -157,6 +250,8 @@ def main():
                 if os.path.exists(tmp): os.remove(tmp)
             except Exception:
                 pass
+    session.close()
+    log(stats_line())
     log(f"DONE: ok={ok}, fail={fail}")
     return 0 if fail==0 else 2
 
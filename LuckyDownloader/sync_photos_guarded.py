@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
-import os, re, sys, time
+# Дельта-синк фото с Я.Диска по манифесту.
+# • Сравнивает листинг (modified, md5, size) с state/photos_manifest.json и качает только изменённые/новые EAN
+#   (плюс те, которых ещё нет в vectorized).
+# • Удалённые с Диска EAN удаляются из original/ — только если листинг полный.
+# • Точный набор изменений копится в state/photos_changes.json для image_opt.py --changes.
+import os, re, sys, json, time
 from pathlib import Path
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -10,10 +15,40 @@ try:
 except Exception:
     pass
 
-from photo_sync.yandex_api import get_all_files_recursive, download_files_with_check, write_photo_log
+from photo_sync.yandex_api import list_files, download_files_with_check, write_photo_log
 from config import YANDEX_DISK_LINK_PHOTOS, PHOTO_DOWNLOAD_PATH, ALLOWED_PHOTO_EXTENSIONS
+from yandex_disk import is_changed  # md5 > size > modified; старые записи манифеста — только modified
 
 VALID_NAME = re.compile(r'^\d{13}\.(jpg|jpeg|png)$', re.IGNORECASE)
+STATE_DIR = "/srv/luckypack/project/LuckyDownloader/state"
+MANIFEST_PATH = os.path.join(STATE_DIR, "photos_manifest.json")
+CHANGES_PATH = os.path.join(STATE_DIR, "photos_changes.json")
+
+def load_json(path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return default
+
+def dump_json_atomic(path, obj):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def record_changes(changed_paths, deleted_eans):
+    """Дописывает изменения в очередь для image_opt.py (объединение с ещё не обработанными)."""
+    pending = load_json(CHANGES_PATH, {})
+    fresh = {Path(p).stem for p in changed_paths}
+    deleted = (set(pending.get("deleted", [])) - fresh) | set(deleted_eans)
+    changed = {p for p in set(pending.get("changed", [])) | set(changed_paths) if Path(p).stem not in deleted}
+    dump_json_atomic(CHANGES_PATH, {
+        "updated": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "changed": sorted(changed),
+        "deleted": sorted(deleted),
+    })
 
 def main():
     try:
@@ -25,68 +60,78 @@ def main():
         write_photo_log("❌ Guard: YANDEX_DISK_LINK_PHOTOS не задан"); print("no link"); return
 
     # 1) Все валидные файлы с Диска
-    files = get_all_files_recursive(link)
+    files, complete = list_files(link)
     filtered = [f for f in files if VALID_NAME.match((f.get('name') or '').strip())]
-    write_photo_log(f"🔎 Guard: валидных на диске: {len(filtered)}")
-    # --- DETECTOR: changed-by-modified ---
-    # Слепок modified по облаку -> сравнение с манифестом
-    cloud_mod = {}
-    for f in filtered:
-        name = (f.get("name") or "").strip()
-        path = f.get("path")
-        mod  = f.get("modified")
-        ean  = os.path.splitext(name)[0]
-        if re.fullmatch(r"\d{13}", ean):
-            cloud_mod[ean] = {"modified": mod, "path": path}
-
-    manifest_path = "/srv/luckypack/project/LuckyDownloader/state/photos_manifest.json"
-    try:
-        import json
-        if os.path.exists(manifest_path):
-            with open(manifest_path, "r", encoding="utf-8") as mf:
-                manifest = json.load(mf)
-        else:
-            manifest = {}
-    except Exception:
-        manifest = {}
+    write_photo_log(f"🔎 Guard: валидных на диске: {len(filtered)}; листинг полный: {complete}")
 
-    changed = []
-    for ean, meta in cloud_mod.items():
-        old = manifest.get(ean, {})
-        if old.get("modified") != meta.get("modified"):
-            changed.append(ean)
-
-    # Логируем сухую статистику
-    try:
-        write_photo_log(f"🛈 Changed-by-modified: {len(changed)}; sample: {sorted(changed)[:10]}")
-    except Exception:
-        pass
+    cloud = {}  # ean -> {modified, md5, size, path}
+    by_ean = {}
+    for f in filtered:
+        ean = os.path.splitext((f.get("name") or "").strip())[0]
+        if ean in cloud: continue  # первая по пути (листинг отсортирован)
+        cloud[ean] = {"modified": f.get("modified"), "md5": f.get("md5"), "size": f.get("size"), "path": f.get("path")}
+        by_ean[ean] = f
 
-    # Обновляем манифест на текущий снимок
-    try:
-        with open(manifest_path, "w", encoding="utf-8") as mf:
-            json.dump(cloud_mod, mf, ensure_ascii=False, indent=2)
-    except Exception as e:
-        write_photo_log(f"Manifest write error: {e}")
-    # --- /DETECTOR ---
+    # 2) Дельта против манифеста
+    manifest = load_json(MANIFEST_PATH, {})
+    changed = {ean for ean, meta in cloud.items() if is_changed(manifest.get(ean), meta)}
+    deleted = sorted(set(manifest) - set(cloud)) if complete else []
 
-    # 2) Уже имеющиеся EAN в vectorized
+    # EAN, которых нет в vectorized, тоже качаем (первичное наполнение / потерянные файлы)
     have = set()
     for _, _, fnames in os.walk("/app/data/photos/vectorized"):
         for n in fnames:
             m = re.match(r'^(\d{13})\.webp$', n, re.IGNORECASE)
             if m: have.add(m.group(1))
+    missing = set(cloud) - have - changed
+    to_fetch = sorted(changed | missing)
+    write_photo_log(f"🛈 Delta: изменено {len(changed)}, нет в vectorized {len(missing)}, удалено на диске {len(deleted)}; "
+                    f"sample: {to_fetch[:10]}")
 
-    # 3) Фильтрация: оставить только те, которых нет в vectorized
-    def ean_of(name:str)->str:
-        return os.path.splitext(name)[0]
-    filtered2 = [f for f in filtered if ean_of(f['name']) not in have]
-    write_photo_log(f"�� Guard: уже в vectorized: {len(have)}; будет скачано: {len(filtered2)}")
+    # 3) Скачивание только дельты (без чистки «лишнего» — удаления обрабатываем явно ниже).
+    #    Изменённые перекачиваем поверх; «нет в vectorized» — только если оригинала нет локально,
+    #    иначе не сконвертированный (или битый) файл качался бы заново при каждом запуске.
+    fetched = set()
+    for eans, overwrite in ((changed, True), (missing, False)):
+        if not eans:
+            continue
+        names = download_files_with_check([by_ean[e] for e in sorted(eans)], PHOTO_DOWNLOAD_PATH, link,
+                                          allowed_extensions=ALLOWED_PHOTO_EXTENSIONS,
+                                          prune_extra=False, overwrite=overwrite)
+        fetched |= {os.path.splitext(n)[0] for n in names or []}
+
+    # 4) Удаления с Диска -> удаляем оригиналы
+    for ean in deleted:
+        for ext in ALLOWED_PHOTO_EXTENSIONS:
+            p = os.path.join(PHOTO_DOWNLOAD_PATH, f"{ean}{ext}")
+            if os.path.exists(p):
+                os.remove(p); write_photo_log(f"Removed deleted on disk: {ean}{ext}")
+
+    # 5) Манифест: неудачные закачки изменённых оставляем со старыми метаданными — повторим в следующий раз
+    #    (отсутствующие в vectorized не менялись — и так попадут в missing, пока нет webp)
+    new_manifest = {}
+    for ean, meta in cloud.items():
+        if ean in fetched or ean not in changed:
+            new_manifest[ean] = meta
+        elif ean in manifest:
+            new_manifest[ean] = manifest[ean]
+    if not complete:
+        for ean, meta in manifest.items():
+            new_manifest.setdefault(ean, meta)
+    try:
+        dump_json_atomic(MANIFEST_PATH, new_manifest)
+    except Exception as e:
+        write_photo_log(f"Manifest write error: {e}")
 
-    if not filtered2:
-        write_photo_log("⚠️ Guard: новинок нет — к скачиванию 0."); print("no new"); return
+    # 6) Точный набор изменений — для image_opt.py --changes
+    changed_paths = []
+    for ean in sorted(fetched):
+        ext = os.path.splitext(by_ean[ean]["name"])[1].lower()
+        changed_paths.append(os.path.join(PHOTO_DOWNLOAD_PATH, f"{ean}{ext}"))
+    if changed_paths or deleted:
+        record_changes(changed_paths, deleted)
+    write_photo_log(f"✅ Delta: скачано {len(fetched)} из {len(to_fetch)}, удалено {len(deleted)}")
+    print("ok" if to_fetch or deleted else "no new")
 
-    download_files_with_check(filtered2, PHOTO_DOWNLOAD_PATH, link, allowed_extensions=ALLOWED_PHOTO_EXTENSIONS)
-    print("ok")
 if __name__ == "__main__":
     main()
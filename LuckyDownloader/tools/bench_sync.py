@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_sync.py — офлайн-бенчмарк синка с Я.Диска на локальной подмене (fake_yadisk.py).
+
+ЧТО МЕРЯЕТ
+- list   : листинг дерева фото (yandex_disk.list_tree) — холодный и повторный с кэшем листинга;
+- photos : скачивание оригиналов фото (photo_sync.yandex_api.download_files_with_check);
+- pull   : pull_missing_to_vectorized.pull_streaming (скачивание в память + WebP);
+- prices : price_cache.main() — первый прогон и повторный (без изменений).
+По каждому этапу: время, файлов/с, МБ/с, запросы к API и помехи со стороны сервера,
+повторы/429/5xx со стороны клиента (yandex_disk.STATS).
+
+Всё пишется во временную папку; алерты админу на время бенчмарка отключены.
+
+ЗАПУСК
+  python3 bench_sync.py --dirs 20 --files-per-dir 200 --latency-ms 20 --error-rate 0.02
+  python3 bench_sync.py --only list,prices
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, "..", ".."))
+sys.path[:0] = [HERE, ROOT, os.path.join(ROOT, "LuckyDownloader")]
+
+STAGES = ("list", "photos", "pull", "prices")
+
+
+def fmt_row(name, dt, files, nbytes, srv_delta, cli_delta):
+    mb = nbytes / 1024 / 1024
+    return (f"{name:<14} {dt:7.2f} с  {files:6d} файлов  {files / max(dt, 1e-6):8.1f} ф/с  {mb / max(dt, 1e-6):7.2f} МБ/с  "
+            f"API {srv_delta.get('list', 0) + srv_delta.get('href', 0):6d}  "
+            f"помехи 429/503 {srv_delta.get('injected_429', 0)}/{srv_delta.get('injected_503', 0)}  "
+            f"повторов {cli_delta.get('retries', 0)}  отказов {cli_delta.get('failed', 0)}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк синка с Я.Диска на локальной подмене")
+    ap.add_argument("--dirs", type=int, default=10)
+    ap.add_argument("--files-per-dir", type=int, default=100)
+    ap.add_argument("--file-kb", type=int, default=256, help="размер прайса, КБ")
+    ap.add_argument("--latency-ms", type=float, default=10)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--throttle-rate", type=float, default=0.0)
+    ap.add_argument("--only", default=",".join(STAGES), help="этапы через запятую: " + ",".join(STAGES))
+    ap.add_argument("--keep", action="store_true", help="не удалять временную папку")
+    a = ap.parse_args()
+    stages = [s for s in a.only.split(",") if s in STAGES]
+
+    import fake_yadisk
+    srv, api_base = fake_yadisk.start(0, a.latency_ms, a.error_rate, a.throttle_rate,
+                                      dirs=a.dirs, files_per_dir=a.files_per_dir, file_kb=a.file_kb)
+    work = tempfile.mkdtemp(prefix="bench_sync_")
+    # окружение — до импорта модулей синка: они читают его при импорте
+    os.environ.update({
+        "YADISK_API_BASE": api_base,
+        "LOGS_DIR": os.path.join(work, "logs"),
+        "PHOTO_DOWNLOAD_PATH": os.path.join(work, "original"),
+        "YANDEX_DISK_LINK_PHOTOS": "photos",
+        "YANDEX_DISK_LINK_PRICES": "prices",
+        "FORCE_UPDATE": "1",
+    })
+
+    import yandex_disk
+    from photo_sync import yandex_api
+    yandex_api.notify_admin = lambda *args, **kw: None
+    yandex_api.LIST_CACHE_PATH = os.path.join(work, "state", "photos_listing_cache.json")
+
+    def snap():
+        return dict(srv.counts), dict(yandex_disk.STATS)
+
+    def delta(before):
+        s0, c0 = before
+        s1, c1 = snap()
+        return {k: s1[k] - s0[k] for k in s1}, {k: c1[k] - c0[k] for k in c1}
+
+    print(f"Дерево: {a.dirs} папок × {a.files_per_dir} файлов; задержка {a.latency_ms} мс; "
+          f"503 {a.error_rate:.0%}, 429 {a.throttle_rate:.0%}; папка {work}")
+    rows = []
+    files = None
+    try:
+        if "list" in stages or "photos" in stages or "pull" in stages:
+            # кэш листинга во временной папке пуст: первый проход холодный, второй — с кэшем
+            for name in ("list cold", "list warm") if "list" in stages else ("list cold",):
+                b = snap(); t0 = time.monotonic()
+                files, complete = yandex_api.list_files("photos")
+                dt = time.monotonic() - t0
+                sd, cd = delta(b)
+                rows.append(fmt_row(name, dt, len(files), 0, sd, cd) + ("" if complete else "  НЕПОЛНЫЙ"))
+
+        if "photos" in stages:
+            b = snap(); t0 = time.monotonic()
+            names = yandex_api.download_files_with_check(files, os.environ["PHOTO_DOWNLOAD_PATH"], "photos",
+                                                         prune_extra=False)
+            dt = time.monotonic() - t0
+            sd, cd = delta(b)
+            rows.append(fmt_row("photos", dt, len(names), sd["bytes"], sd, cd))
+
+        if "pull" in stages:
+            import pull_missing_to_vectorized as pull
+            pull.VEC_DIR = os.path.join(work, "vectorized")
+            pull.LOGF = os.path.join(work, "logs", "photos_pull.log")
+            cloud_map = {os.path.splitext(f["name"])[0]: f for f in files}
+            b = snap(); t0 = time.monotonic()
+            ok, fail = pull.pull_streaming("photos", set(cloud_map), cloud_map)
+            dt = time.monotonic() - t0
+            sd, cd = delta(b)
+            rows.append(fmt_row("pull --stream", dt, ok, sd["bytes"], sd, cd) + (f"  ошибок {fail}" if fail else ""))
+
+        if "prices" in stages:
+            from LuckyPricer import price_cache
+            data = os.path.join(work, "prices")
+            price_cache.LOCAL_PRICE_DIR = data
+            price_cache.LAST_UPDATE_FILE = os.path.join(work, "state", "last_update.txt")
+            price_cache.LIST_CACHE_FILE = os.path.join(work, "state", "prices_listing_cache.json")
+            price_cache.MANIFEST_FILE = os.path.join(work, "state", "prices_manifest.json")
+            price_cache.CHANGED_FILE = os.path.join(work, "state", "changed_prices.json")
+            for name in ("prices", "prices no-op"):
+                b = snap(); t0 = time.monotonic()
+                price_cache.main()
+                dt = time.monotonic() - t0
+                sd, cd = delta(b)
+                rows.append(fmt_row(name, dt, sd["download"], sd["bytes"], sd, cd))
+    finally:
+        srv.shutdown()
+        if not a.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    print()
+    print("\n".join(rows))
+    print(yandex_disk.stats_line())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
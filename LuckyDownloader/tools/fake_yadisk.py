@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fake_yadisk.py — локальная подмена публичного API Яндекс.Диска для тестов и бенчмарков синка.
+
+ЭНДПОИНТЫ (как у cloud-api.yandex.net/v1/disk)
+- GET /v1/disk/public/resources?public_key&path&limit&offset — листинг папки (_embedded.items/total),
+  у файлов есть name/path/type/modified/md5/size.
+- GET /v1/disk/public/resources/download?public_key&path — {"href": ...}
+- GET /dl/<public_key><path> — содержимое файла, поддерживает Range (206).
+
+ДЕРЕВО (отдельное на каждый public_key)
+- "photos": dirs папок по files_per_dir фото <EAN-13>.jpg (настоящий JPEG — pull_missing его перекодирует).
+- "prices": dirs папок по files_per_dir прайсов *.xlsx (случайные байты file_kb КБ).
+- Любой другой ключ — 404.
+
+ПОМЕХИ
+- latency_ms — задержка на каждый ответ;
+- error_rate — доля ответов 503, throttle_rate — доля ответов 429 с Retry-After: 1.
+
+href на скачивание выдаётся на хост "localhost", а API слушает "127.0.0.1" — так лимитер
+yandex_disk.YandexClient, как и в проде, действует только на запросы к API.
+
+ЗАПУСК
+  python3 fake_yadisk.py --port 8780 --dirs 20 --files-per-dir 500 --latency-ms 20 --error-rate 0.01
+  YADISK_API_BASE=http://127.0.0.1:8780/v1/disk YANDEX_DISK_LINK_PHOTOS=photos python3 ../sync_photos_guarded.py
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, quote, unquote, urlparse
+
+MODIFIED = "2024-01-01T00:00:00+00:00"
+
+
+def _jpeg_bytes():
+    try:
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.new("RGB", (640, 640), (200, 120, 40)).save(buf, "JPEG", quality=85)
+        return buf.getvalue()
+    except Exception:
+        return os.urandom(64 * 1024)  # без Pillow — просто байты (--stream их не перекодирует)
+
+
+def build_trees(dirs=10, files_per_dir=100, file_kb=256, seed=1):
+    """{public_key: {path: node}}; node — dict папки (children) или файла (data, md5, size)."""
+    rnd = random.Random(seed)
+    jpeg = _jpeg_bytes()
+    blob = rnd.randbytes(file_kb * 1024)
+    trees = {}
+    for kind in ("photos", "prices"):
+        tree = {"/": {"type": "dir", "name": "", "path": "/", "modified": MODIFIED, "children": []}}
+        n = 0
+        for d in range(dirs):
+            dpath = f"/{kind}_{d:03d}"
+            tree[dpath] = {"type": "dir", "name": dpath[1:], "path": dpath, "modified": MODIFIED, "children": []}
+            tree["/"]["children"].append(dpath)
+            for _ in range(files_per_dir):
+                if kind == "photos":
+                    name, data = f"{4600000000000 + n:013d}.jpg", jpeg
+                else:
+                    name, data = f"price_{n:05d}.xlsx", blob
+                n += 1
+                fpath = f"{dpath}/{name}"
+                tree[fpath] = {"type": "file", "name": name, "path": fpath, "modified": MODIFIED,
+                               "data": data, "md5": None, "size": len(data)}
+                tree[dpath]["children"].append(fpath)
+        trees[kind] = tree
+    md5s = {}
+    for tree in trees.values():
+        for node in tree.values():
+            if node["type"] == "file":
+                key = id(node["data"])
+                if key not in md5s:
+                    md5s[key] = hashlib.md5(node["data"]).hexdigest()
+                node["md5"] = md5s[key]
+    return trees
+
+
+class FakeDisk(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, trees, latency_ms=0, error_rate=0.0, throttle_rate=0.0, seed=1):
+        super().__init__(addr, Handler)
+        self.trees = trees
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"list": 0, "href": 0, "download": 0, "injected_503": 0, "injected_429": 0, "bytes": 0}
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    def roll(self):
+        with self.lock:
+            return self.rnd.random()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего API
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body=b"", ctype="application/json", headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, code, obj):
+        self._send(code, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+    def do_GET(self):
+        srv = self.server
+        if srv.latency:
+            time.sleep(srv.latency)
+        url = urlparse(self.path)
+        q = dict(parse_qsl(url.query))
+        r = srv.roll()
+        if r < srv.throttle_rate:
+            srv.count("injected_429")
+            return self._send(429, b'{"error":"TooManyRequestsError"}', headers={"Retry-After": "1"})
+        if r < srv.throttle_rate + srv.error_rate:
+            srv.count("injected_503")
+            return self._json(503, {"error": "ServiceUnavailable"})
+
+        if url.path == "/v1/disk/public/resources":
+            return self._list(q)
+        if url.path == "/v1/disk/public/resources/download":
+            return self._href(q)
+        m = re.match(r"^/dl/([^/]+)(/.*)$", url.path)
+        if m:
+            return self._download(unquote(m.group(1)), unquote(m.group(2)))
+        self._json(404, {"error": "NotFound"})
+
+    def _node(self, key, path):
+        tree = self.server.trees.get(key)
+        return tree.get(path or "/") if tree else None
+
+    def _list(self, q):
+        srv = self.server
+        srv.count("list")
+        node = self._node(q.get("public_key"), q.get("path"))
+        if not node:
+            return self._json(404, {"error": "DiskNotFoundError"})
+        if node["type"] == "file":
+            return self._json(200, {k: v for k, v in node.items() if k != "data"})
+        tree = srv.trees[q["public_key"]]
+        offset, limit = int(q.get("offset", 0)), int(q.get("limit", 20))
+        items = []
+        for p in node["children"][offset:offset + limit]:
+            c = tree[p]
+            items.append({k: v for k, v in c.items() if k not in ("data", "children")})
+        self._json(200, {"type": "dir", "path": node["path"],
+                         "_embedded": {"items": items, "total": len(node["children"]), "offset": offset, "limit": limit}})
+
+    def _href(self, q):
+        self.server.count("href")
+        key, path = q.get("public_key"), q.get("path")
+        node = self._node(key, path)
+        if not node or node["type"] != "file":
+            return self._json(404, {"error": "DiskNotFoundError"})
+        port = self.server.server_address[1]
+        self._json(200, {"href": f"http://localhost:{port}/dl/{quote(key, safe='')}{quote(path)}", "method": "GET"})
+
+    def _download(self, key, path):
+        node = self._node(key, path)
+        if not node or node["type"] != "file":
+            return self._json(404, {"error": "DiskNotFoundError"})
+        data = node["data"]
+        rng = re.match(r"bytes=(\d+)-", self.headers.get("Range") or "")
+        start = int(rng.group(1)) if rng else 0
+        if start >= len(data) and start:
+            return self._send(416, b"")
+        body = data[start:]
+        self.server.count("download"); self.server.count("bytes", len(body))
+        if rng:
+            return self._send(206, body, "application/octet-stream",
+                              {"Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"})
+        self._send(200, body, "application/octet-stream")
+
+
+def start(port=0, latency_ms=0, error_rate=0.0, throttle_rate=0.0, **tree_kwargs):
+    """Поднимает сервер в фоновом потоке; возвращает (server, api_base)."""
+    srv = FakeDisk(("127.0.0.1", port), build_trees(**tree_kwargs), latency_ms, error_rate, throttle_rate)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_address[1]}/v1/disk"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Локальная подмена публичного API Яндекс.Диска")
+    ap.add_argument("--port", type=int, default=8780)
+    ap.add_argument("--dirs", type=int, default=10)
+    ap.add_argument("--files-per-dir", type=int, default=100)
+    ap.add_argument("--file-kb", type=int, default=256, help="размер прайса, КБ")
+    ap.add_argument("--latency-ms", type=float, default=0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--throttle-rate", type=float, default=0.0)
+    a = ap.parse_args()
+    srv, base = start(a.port, a.latency_ms, a.error_rate, a.throttle_rate,
+                      dirs=a.dirs, files_per_dir=a.files_per_dir, file_kb=a.file_kb)
+    print(f"fake Yandex Disk: YADISK_API_BASE={base}; public_key: photos | prices")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
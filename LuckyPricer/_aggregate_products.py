@@ -6,13 +6,34 @@
 - ключ "Штрихкод" всегда выбрасывается;
 - поле "Артикул" обязательно (строка, не пустая);
   если в записи нет "Артикул", но есть "Штрихкод" — копируем его в "Артикул" и Штрихкод НЕ сохраняем;
-- порядок детерминированный: сортируем по "Артикул".
-Лог в stdout: "готово: N; первые: A1, A2, A3".
+- порядок детерминированный: prices_to_json пишет каждый файл уже отсортированным по "Артикул"
+  (массив, одна запись на строку) — файлы читаются построчно и сливаются k-way слиянием
+  (heapq.merge); поток слияния за один проход идёт в дифф, products.json и каталог —
+  ни файлы, ни общий список в памяти целиком не держатся. Файлы старого формата
+  (json.dump с отступами) читаются целиком и сортируются, как раньше;
+- один артикул — одна запись. При дублях побеждает источник с высшим приоритетом
+  (PRODUCTS_SOURCE_PRIORITY — подстроки имён файлов через запятую, раньше = главнее),
+  дальше — более новый файл (mtime), дальше — имя файла; внутри файла — последняя запись.
+- вместе с products.json пишется скомпилированный каталог products.sqlite (см. catalog.py) —
+  читатели открывают его через mmap вместо разбора всего json.
+- перед перезаписью считается дифф с предыдущим поколением (слиянием двух отсортированных по
+  "Артикул" потоков; прежнее поколение читается из каталога по индексу артикула, лениво):
+  added / removed / price_changed → data/products_diff.json;
+  цены сравниваются в копейках («<цена>, коп»), а не строками.
+  Индексы, выгрузки и уведомления могут брать только дельту.
+Лог в stdout: "готово: N; первые: A1, A2, A3; дубли: …" и строка диффа.
 """
-import json, glob, os, sys
+import json, glob, heapq, os, sys, time
+from itertools import chain
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from catalog import build as build_catalog, records_by_article as load_generation, PRICE_KEYS, kop_key, price_kop
 
 SRC_DIR = "/srv/luckypack/project/LuckyPricer/data/jsons"
 OUT_FP  = "/srv/luckypack/project/LuckyPricer/products.json"
+CATALOG_FP = "/srv/luckypack/project/LuckyPricer/products.sqlite"
+DIFF_FP = "/srv/luckypack/project/LuckyPricer/data/products_diff.json"
+SOURCE_PRIORITY = [p.strip() for p in os.getenv("PRODUCTS_SOURCE_PRIORITY", "").split(",") if p.strip()]
 
 def normalize_item(it: dict) -> dict:
     it = dict(it)  # копия
@@ -38,29 +59,160 @@ def load_any_json(path):
     except Exception:
         return None
 
+def source_rank(fp) -> tuple:
+    """Ранг файла-источника: меньше — главнее (приоритет, затем новее, затем имя)."""
+    name = os.path.basename(fp)
+    prio = next((i for i, pat in enumerate(SOURCE_PRIORITY) if pat in name), len(SOURCE_PRIORITY))
+    return (prio, -os.path.getmtime(fp), name)
+
+def _sorted_run(recs, rank, fp):
+    """
+    (артикул, ранг, -позиция, запись) из записей, уже отсортированных по артикулу. Дубли внутри
+    файла идут подряд — отдаём их с конца (последняя в файле — победитель), держа в памяти только их.
+    """
+    group = []
+    for pos, r in enumerate(recs):
+        r2 = normalize_item(r) if isinstance(r, dict) else None
+        if not r2:
+            continue
+        t = (r2["Артикул"], rank, -pos, r2)
+        if group and t[0] != group[0][0]:
+            if t[0] < group[0][0]:
+                raise RuntimeError(f"{os.path.basename(fp)}: не отсортирован по артикулу "
+                                   f"({group[0][0]} → {t[0]}) — перегенерировать: prices_to_json.py --force")
+            yield from reversed(group); group = []
+        group.append(t)
+    yield from reversed(group)
+
+def _json_lines(lines):
+    """Записи массива, где каждая запись — одна строка (формат prices_to_json.write_json_records)."""
+    for line in lines:
+        line = line.strip().rstrip(",")
+        if line and line != "]":
+            yield json.loads(line)
+
+def file_run(fp):
+    """Записи одного файла по (артикул, ранг, -позиция): первая по артикулу — победитель. Читается построчно."""
+    rank = source_rank(fp)
+    with open(fp, "r", encoding="utf-8") as f:
+        first, second = f.readline().strip(), f.readline()
+        if first == "[" and second.startswith("{"):
+            yield from _sorted_run(_json_lines(chain([second], f)), rank, fp)
+            return
+    # старый формат (с отступами) или одиночный объект — целиком, с сортировкой
+    data = load_any_json(fp)
+    recs = data if isinstance(data, list) else [data] if isinstance(data, dict) else []  # всё остальное молча мимо
+    run = [(r2["Артикул"], rank, -pos, r2) for pos, r in enumerate(recs)
+           if isinstance(r, dict) for r2 in [normalize_item(r)] if r2]
+    run.sort(key=lambda t: t[:3])
+    yield from run
+
+def merge_runs(runs, stats):
+    """k-way слияние отсортированных прогонов; на артикул отдаёт одну запись, дубли считает в stats."""
+    cur = win = None
+    counted = cross = False
+    for art, rank, _, rec in heapq.merge(*runs, key=lambda t: t[:3]):
+        if art != cur:
+            cur, win, counted, cross = art, rank, False, False
+            yield rec
+            continue
+        stats["dropped"] += 1
+        if not counted:
+            stats["articles"] += 1; counted = True
+        if rank != win and not cross:
+            stats["cross_file"] += 1; cross = True
+
+def _last_per_article(pairs):
+    """Поток (артикул, запись), отсортированный по артикулу, без дублей (при дублях — последняя, как в каталоге)."""
+    cur = None
+    for art, rec in pairs:
+        if cur is not None and cur[0] != art:
+            yield cur
+        cur = (art, rec)
+    if cur is not None:
+        yield cur
+
+def _sorted_pairs(items):
+    return sorted(((str(it.get("Артикул", "")).strip(), it) for it in items), key=lambda t: t[0])
+
+def diff_stream(old, new, diff):
+    """
+    Пропускает записи new (отсортированы по артикулу, без дублей) насквозь и попутно считает
+    в diff added / removed / price_changed относительно old — слиянием двух отсортированных потоков.
+    old — поток (артикул, запись) по возрастанию артикула (см. catalog.records_by_article).
+    """
+    old = _last_per_article(old)
+    diff.update({"built": time.strftime("%Y-%m-%d %H:%M:%S"), "prev_count": 0, "count": 0,
+                 "added": [], "removed": [], "price_changed": []})
+    o = next(old, None)
+    for rec in new:
+        b = rec["Артикул"]
+        while o is not None and o[0] < b:
+            diff["removed"].append(o[0]); diff["prev_count"] += 1; o = next(old, None)
+        if o is not None and o[0] == b:
+            po = {kop_key(k): price_kop(o[1], k) for k in PRICE_KEYS}  # сравниваем копейки, не строки
+            pn = {kop_key(k): price_kop(rec, k) for k in PRICE_KEYS}
+            if po != pn:
+                diff["price_changed"].append({"Артикул": b, "old": po, "new": pn})
+            diff["prev_count"] += 1; o = next(old, None)
+        else:
+            diff["added"].append(b)
+        diff["count"] += 1
+        yield rec
+    while o is not None:
+        diff["removed"].append(o[0]); diff["prev_count"] += 1; o = next(old, None)
+
+def diff_generations(old, new) -> dict:
+    """added / removed / price_changed между поколениями (списки записей) — один проход слиянием по артикулу."""
+    diff = {}
+    for _ in diff_stream(_sorted_pairs(old), (r for _, r in _last_per_article(_sorted_pairs(new))), diff):
+        pass
+    return diff
+
+def tee_json(items, f):
+    """Пишет записи в f (как json.dump(..., indent=2)) по одной и отдаёт их дальше."""
+    n = 0
+    for it in items:
+        body = json.dumps(it, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        f.write(("[\n  " if n == 0 else ",\n  ") + body)
+        n += 1
+        yield it
+    f.write("\n]" if n else "[]")
+
+def save_diff(diff, path=DIFF_FP):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(diff, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
 def main() -> int:
     files = sorted(glob.glob(os.path.join(SRC_DIR, "*.json")))
-    items = []
-    for fp in files:
-        data = load_any_json(fp)
-        if data is None:
-            continue
-        if isinstance(data, list):
-            for r in data:
-                if isinstance(r, dict):
-                    r2 = normalize_item(r)
-                    if r2: items.append(r2)
-        elif isinstance(data, dict):
-            r2 = normalize_item(data)
-            if r2: items.append(r2)
-        # всё остальное игнорируем молча
-    # детерминируем порядок
-    items.sort(key=lambda x: x.get("Артикул",""))
-    # запись
-    with open(OUT_FP, "w", encoding="utf-8") as f:
-        json.dump(items, f, ensure_ascii=False, indent=2)
-    first3 = [it["Артикул"] for it in items[:3]]
-    print(f"готово: {len(items)}; первые: {', '.join(first3)}")
+    stats = {"articles": 0, "dropped": 0, "cross_file": 0}
+    first3 = []
+    def head(items):
+        for it in items:
+            if len(first3) < 3: first3.append(it["Артикул"])
+            yield it
+    # один проход по слиянию: дифф с предыдущим поколением → products.json → каталог
+    old = load_generation(CATALOG_FP, OUT_FP)  # прежнее поколение: поток по артикулу, дочитывается до подмены файлов
+    diff = {}
+    tmp = OUT_FP + ".tmp"  # атомарно: читатели (ProductCatalog) не должны застать полузаписанный файл
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            stream = tee_json(diff_stream(old, head(merge_runs(map(file_run, files), stats)), diff), f)
+            n = build_catalog(stream, CATALOG_FP)
+        os.replace(tmp, OUT_FP)
+        # хвост json дописывается при закрытии — уже после каталога; каталог должен быть
+        # не старше products.json, иначе читатели его не возьмут
+        os.utime(CATALOG_FP)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    save_diff(diff, DIFF_FP)
+    print(f"готово: {n}; первые: {', '.join(first3)}; дубли: {stats['articles']} арт., "
+          f"отброшено записей {stats['dropped']} (из разных файлов: {stats['cross_file']} арт.)")
+    print(f"дифф: +{len(diff['added'])} −{len(diff['removed'])} ~{len(diff['price_changed'])} (цены) → {DIFF_FP}")
     return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+catalog.py — скомпилированный каталог товаров (SQLite рядом с products.json).
+
+Зачем:
+- products.json разбирался целиком в каждом читателе (search_photo, pull_missing_to_vectorized,
+  sync_planner/list_product_articles, build_text_index, build_image_index), и каждый строил свой dict. Каталог открывается только на чтение через mmap и отдаёт
+  нужные записи по индексу артикула за миллисекунды.
+
+Формат (products.sqlite):
+- products(pos INTEGER PRIMARY KEY, art TEXT, name TEXT, rec TEXT) — записи в порядке products.json,
+  rec — исходная запись в JSON; индекс по art. Дубли артикула сохраняются; для поиска по артикулу
+  берётся последняя запись (как dict, собранный из списка).
+- meta(k, v): built, count, version.
+
+Пишет: _aggregate_products.py (build). Читают: records / records_by_article / by_article / get_many / articles.
+Если каталога нет или он старше products.json — читатели прозрачно падают обратно на products.json.
+
+ProductCatalog — общий каталог в памяти для долгоживущих процессов (бот): записи Product на __slots__
+с ценами в копейках (int), поиск по артикулу за O(1), сам перечитывается, когда меняется
+products.sqlite/products.json. В процессе один экземпляр — shared().
+"""
+import json, os, sqlite3, threading, time
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+PRODUCTS_JSON = Path(os.getenv("PRODUCTS_JSON", "/srv/luckypack/project/LuckyPricer/products.json"))
+CATALOG_DB = Path(os.getenv("PRODUCTS_DB", "/srv/luckypack/project/LuckyPricer/products.sqlite"))
+MMAP_SIZE = 256 * 1024 * 1024
+VERSION = 1
+NAME_KEYS = ("Наименование", "Номенклатура, Характеристика, Упаковка", "Номенклатура")
+PRICE_KEYS = ("ОПТ с НДС", "ОПТ с НДС от 150 000 руб.", "СПЕЦ ЦЕНА")
+KOP_SUFFIX = ", коп"  # рядом с исходной строкой цены prices_to_json пишет её же в копейках: "ОПТ с НДС, коп": 9350
+RELOAD_CHECK_S = float(os.getenv("PRODUCTS_RELOAD_CHECK_S", "5"))  # как часто смотреть mtime файлов
+
+
+def build(items, db_path=CATALOG_DB) -> int:
+    """Собирает каталог из записей (список или поток; уже нормализованных, с «Артикул») и атомарно подменяет файл."""
+    db_path = Path(db_path)
+    tmp = db_path.with_name(db_path.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    con = sqlite3.connect(str(tmp))
+    try:
+        con.execute("PRAGMA journal_mode=OFF")
+        con.execute("PRAGMA synchronous=OFF")
+        con.execute("CREATE TABLE products (pos INTEGER PRIMARY KEY, art TEXT NOT NULL, name TEXT, rec TEXT NOT NULL)")
+        con.execute("CREATE TABLE meta (k TEXT PRIMARY KEY, v TEXT)")
+        rows = ((i, str(it.get("Артикул", "")).strip(), next((str(it[k]) for k in NAME_KEYS if it.get(k)), ""),
+                 json.dumps(it, ensure_ascii=False)) for i, it in enumerate(items))
+        con.executemany("INSERT INTO products VALUES (?,?,?,?)", rows)
+        con.execute("CREATE INDEX idx_products_art ON products(art)")
+        n = con.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        con.executemany("INSERT INTO meta VALUES (?,?)", [
+            ("built", time.strftime("%Y-%m-%d %H:%M:%S")), ("count", str(n)), ("version", str(VERSION))])
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp, db_path)
+    return n
+
+
+def available(db_path=CATALOG_DB, json_path=PRODUCTS_JSON) -> bool:
+    """Каталог есть и не старше products.json (иначе он отстал — читаем json)."""
+    try:
+        db_m = Path(db_path).stat().st_mtime
+    except OSError:
+        return False
+    try:
+        return db_m >= Path(json_path).stat().st_mtime
+    except OSError:
+        return True
+
+
+def connect(db_path=CATALOG_DB) -> sqlite3.Connection:
+    """Соединение только на чтение, файл отображается в память (mmap)."""
+    con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    con.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    con.execute("PRAGMA query_only=ON")
+    return con
+
+
+def _json_records(json_path):
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return []
+    if isinstance(data, dict):
+        data = data.get("items", [data])
+    return [r for r in data if isinstance(r, dict)] if isinstance(data, list) else []
+
+
+def records(db_path=CATALOG_DB, json_path=PRODUCTS_JSON) -> list:
+    """Все записи в порядке products.json."""
+    if not available(db_path, json_path):
+        return _json_records(json_path)
+    con = connect(db_path)
+    try:
+        return [json.loads(r) for (r,) in con.execute("SELECT rec FROM products ORDER BY pos")]
+    finally:
+        con.close()
+
+
+def records_by_article(db_path=CATALOG_DB, json_path=PRODUCTS_JSON):
+    """(артикул, запись) по возрастанию артикула — лениво, по индексу каталога; без каталога — из products.json."""
+    if not available(db_path, json_path):
+        yield from sorted(((str(r.get("Артикул", "")).strip(), r) for r in _json_records(json_path)),
+                          key=lambda t: t[0])
+        return
+    con = connect(db_path)
+    try:
+        for art, rec in con.execute("SELECT art, rec FROM products ORDER BY art, pos"):
+            yield art, json.loads(rec)
+    finally:
+        con.close()
+
+
+def by_article(db_path=CATALOG_DB, json_path=PRODUCTS_JSON) -> dict:
+    """{артикул: запись} по всем товарам (при дублях — последняя)."""
+    return {str(r.get("Артикул", "")).strip(): r for r in records(db_path, json_path)}
+
+
+def get_many(arts, db_path=CATALOG_DB, json_path=PRODUCTS_JSON) -> dict:
+    """{артикул: запись} только для arts — без разбора всего каталога."""
+    arts = [str(a).strip() for a in arts if str(a).strip()]
+    if not arts:
+        return {}
+    if not available(db_path, json_path):
+        want = set(arts)
+        return {k: v for k, v in by_article(db_path, json_path).items() if k in want}
+    out = {}
+    con = connect(db_path)
+    try:
+        for i in range(0, len(arts), 500):  # предел числа параметров SQLite
+            chunk = arts[i:i + 500]
+            q = f"SELECT art, rec FROM products WHERE art IN ({','.join('?' * len(chunk))}) ORDER BY pos"
+            for art, rec in con.execute(q, chunk):
+                out[art] = json.loads(rec)
+    finally:
+        con.close()
+    return out
+
+
+def get(art, db_path=CATALOG_DB, json_path=PRODUCTS_JSON):
+    return get_many([art], db_path, json_path).get(str(art).strip())
+
+
+def articles(db_path=CATALOG_DB, json_path=PRODUCTS_JSON) -> set:
+    """Множество артикулов (строки)."""
+    if not available(db_path, json_path):
+        return {str(r.get("Артикул", "")).strip() for r in _json_records(json_path)} - {""}
+    con = connect(db_path)
+    try:
+        return {a for (a,) in con.execute("SELECT DISTINCT art FROM products") if a}
+    finally:
+        con.close()
+
+
+def _num(v) -> Optional[float]:
+    s = str(v if v is not None else "").replace(" ", "").replace("\u00A0", "").replace(",", ".")
+    if not s:
+        return None
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def _int(v) -> Optional[int]:
+    n = _num(v)
+    return int(n) if n is not None and n == int(n) else None
+
+
+def kop_key(key: str) -> str:
+    return key + KOP_SUFFIX
+
+
+def to_kop(v) -> Optional[int]:
+    """Цена в копейках: "93,50" / "1 234.5 руб" -> 9350 / 123450; None — пусто или не число."""
+    s = str(v if v is not None else "").replace("руб", "").replace("rub", "")
+    s = s.replace(" ", "").replace("\u00A0", "").replace(",", ".")
+    if not s:
+        return None
+    try:
+        d = Decimal(s)
+    except InvalidOperation:
+        return None
+    return int((d * 100).quantize(Decimal(1), ROUND_HALF_UP)) if d.is_finite() else None
+
+
+def fmt_kop(kop: Optional[int]) -> str:
+    """9350 -> "93,50" (как строки цен в прайсах); None -> ""."""
+    if kop is None:
+        return ""
+    sign = "-" if kop < 0 else ""
+    return f"{sign}{abs(kop) // 100},{abs(kop) % 100:02d}"
+
+
+def price_kop(rec: dict, key: str) -> Optional[int]:
+    """Цена записи в копейках: готовое поле «<ключ>, коп» или разбор строки (json старого конвертера)."""
+    kk = kop_key(key)
+    return rec[kk] if kk in rec else to_kop(rec.get(key))
+
+
+class Product:
+    """
+    Компактная запись товара: короткие поля вместо длинных русских ключей, цены — копейки (int или None).
+    Исходные строки (*_text) сохраняются: «по запросу», «10/200» и т.п. не числа, но их надо показывать.
+    """
+    __slots__ = ("art", "name", "category", "per_box", "price", "price_150k", "price_special",
+                 "per_box_text", "price_text", "price_150k_text", "price_special_text")
+
+    def __init__(self, rec: dict):
+        self.art = str(rec.get("Артикул", "")).strip()
+        self.name = next((str(rec[k]) for k in NAME_KEYS if rec.get(k)), "")
+        self.category = str(rec.get("Категория", "") or "")
+        self.per_box = _int(rec.get("ШТ/КОР"))
+        self.price, self.price_150k, self.price_special = (price_kop(rec, k) for k in PRICE_KEYS)
+        self.per_box_text = str(rec.get("ШТ/КОР", "") or "")
+        self.price_text, self.price_150k_text, self.price_special_text = (str(rec.get(k, "") or "") for k in PRICE_KEYS)
+
+    def __repr__(self):
+        return f"Product({self.art!r}, {self.name[:40]!r}, price={fmt_kop(self.price) or None})"
+
+
+class ProductCatalog:
+    """{артикул: Product} в памяти; перечитывается, если сменились mtime/размер каталога или products.json."""
+
+    def __init__(self, db_path=CATALOG_DB, json_path=PRODUCTS_JSON, check_every=RELOAD_CHECK_S):
+        self.db_path, self.json_path = Path(db_path), Path(json_path)
+        self.check_every = check_every
+        self._items: Dict[str, Product] = {}
+        self._stamp = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.loaded_at = None
+
+    def _file_stamp(self):
+        out = []
+        for p in (self.db_path, self.json_path):
+            try:
+                st = p.stat()
+                out.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                out.append(None)
+        return tuple(out)
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._stamp is not None and now - self._checked < self.check_every:
+            return
+        with self._lock:
+            if self._stamp is not None and now - self._checked < self.check_every:
+                return
+            self._checked = now
+            stamp = self._file_stamp()
+            if stamp == self._stamp:
+                return
+            items = {}
+            try:
+                for rec in records(self.db_path, self.json_path):
+                    p = Product(rec)
+                    if p.art:
+                        items[p.art] = p  # при дублях — последняя, как by_article
+            except Exception:
+                items = {}
+            if not items and self._items:
+                return  # файл недописан/битый — остаёмся на старом каталоге, _stamp не меняем: перечитаем позже
+            self._items = items  # подмена целиком: читатели видят либо старый, либо новый словарь
+            self._stamp = stamp
+            self.loaded_at = time.time()
+
+    def get(self, art) -> Optional[Product]:
+        self._refresh()
+        return self._items.get(str(art).strip())
+
+    def get_many(self, arts: Iterable) -> Dict[str, Product]:
+        self._refresh()
+        items = self._items
+        return {a: items[a] for a in (str(x).strip() for x in arts) if a in items}
+
+    def articles(self) -> set:
+        self._refresh()
+        return set(self._items)
+
+    def __contains__(self, art):
+        return self.get(art) is not None
+
+    def __len__(self):
+        self._refresh()
+        return len(self._items)
+
+
+_SHARED = None
+_SHARED_LOCK = threading.Lock()
+
+
+def shared() -> ProductCatalog:
+    """Один ProductCatalog на процесс (пути — из PRODUCTS_JSON/PRODUCTS_DB)."""
+    global _SHARED
+    if _SHARED is None:
+        with _SHARED_LOCK:
+            if _SHARED is None:
+                _SHARED = ProductCatalog()
+    return _SHARED
+
+
+if __name__ == "__main__":
+    # ручная проверка: размер, время открытия и выборки
+    t0 = time.perf_counter()
+    arts = articles()
+    t1 = time.perf_counter()
+    sample = sorted(arts)[:3]
+    got = get_many(sample)
+    t2 = time.perf_counter()
+    src = "sqlite" if available() else "products.json"
+    print(f"{src}: {len(arts)} артикулов за {(t1 - t0) * 1000:.1f} мс; get_many({len(sample)}) за {(t2 - t1) * 1000:.1f} мс")
+    for a in sample:
+        print(a, (got.get(a) or {}).get("Номенклатура, Характеристика, Упаковка", ""))
@@ -50,6 +50,15 @@ def generate_excel(client_name="тестового клиента"):
 
         df["Артикул"] = df["Артикул"].astype(str)
 
+        # берём ровно колонки прайса (в записях есть и служебные поля, например цены «…, коп»)
+        df = df.reindex(columns=[
+            "Артикул",
+            "Номенклатура, Характеристика, Упаковка",
+            "ШТ/КОР",
+            "ОПТ с НДС",
+            "ОПТ с НДС от 150 000 руб.",
+            "СПЕЦ ЦЕНА",
+        ])
         df.columns = [
             "Артикул",
             "Номенклатура, Характеристика, Упаковка",
@@ -7,17 +7,28 @@ price_cache.py — обновляет прайсы с Яндекс.Диска.
 - Пишет логи в /srv/luckypack/logs/price_cache.log.
 - Кладёт xlsx в PROJECT_ROOT/LuckyPricer/data/prices.
 - По умолчанию обновляет не чаще раза в 24 часа. Можно форсировать, установив FORCE_UPDATE=1.
+- Качает только изменённые прайсы: md5/size/modified из листинга сверяются с data/prices_manifest.json,
+  изменённые скачиваются параллельно (PRICE_DL_WORKERS потоков). Их имена копятся в
+  data/changed_prices.json — prices_to_json.py --changed конвертирует только их.
+- Скачивание через yandex_disk.fetch_to_file: докачка оборванных файлов (*.part + HTTP Range),
+  сверка с md5/size из листинга и атомарный rename — битый прайс не подменит рабочий.
+- Запросы к API — через общий yandex_disk.YandexClient (лимит запросов, повторы на 429/5xx).
+- Листинг папок кэшируется (data/prices_listing_cache.json): неизменённые подпапки не перечитываются.
 """
 
 import os
+import sys
 import time
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 import logging
-import requests
 
 # --------- Определяем корень проекта и .env ---------
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))               # .../project/LuckyPricer
 PROJECT_ROOT = os.path.abspath(os.path.join(THIS_DIR, os.pardir))   # .../project
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
 
 # Подхватываем .env из корня проекта, если есть (без зависимостей)
 env_path = os.path.join(PROJECT_ROOT, ".env")
@@ -32,15 +43,24 @@ if os.path.isfile(env_path):
             v = v.strip().strip('"').strip("'")
             os.environ.setdefault(k, v)
 
+from yandex_disk import YandexClient, list_tree, fetch_to_file, stats_line, is_changed  # после .env: YADISK_* читаются при импорте
+
 # --------- Конфигурация ---------
 YANDEX_DISK_LINK_PRICES = os.getenv("YANDEX_DISK_LINK_PRICES", "").strip()
 LOGS_DIR = os.getenv("LOGS_DIR", "/srv/luckypack/logs")
 
 LOCAL_PRICE_DIR = os.path.join(PROJECT_ROOT, "LuckyPricer", "data", "prices")
 LAST_UPDATE_FILE = os.path.join(PROJECT_ROOT, "LuckyPricer", "data", "last_update.txt")
+LIST_CACHE_FILE = os.path.join(PROJECT_ROOT, "LuckyPricer", "data", "prices_listing_cache.json")
+MANIFEST_FILE = os.path.join(PROJECT_ROOT, "LuckyPricer", "data", "prices_manifest.json")
+CHANGED_FILE = os.path.join(PROJECT_ROOT, "LuckyPricer", "data", "changed_prices.json")
+DL_WORKERS = int(os.getenv("PRICE_DL_WORKERS", "4"))
 UPDATE_INTERVAL_HOURS = int(os.getenv("UPDATE_INTERVAL_HOURS", "24"))
 FORCE_UPDATE = os.getenv("FORCE_UPDATE", "0") == "1"
 
+# Общий клиент Я.Диска: лимит запросов и повторы на 429/5xx (yandex_disk.YandexClient)
+CLIENT = YandexClient(pool_size=DL_WORKERS)
+
 os.makedirs(LOGS_DIR, exist_ok=True)
 LOG_FILE = os.path.join(LOGS_DIR, "price_cache.log")
 
@@ -76,33 +96,40 @@ def save_update_time():
     with open(LAST_UPDATE_FILE, "w") as f:
         f.write(str(time.time()))
 
+def load_json(path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return default
+
+def dump_json_atomic(path, obj):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def record_changed(names):
+    """Дописывает имена скачанных прайсов в очередь для prices_to_json.py --changed."""
+    pending = load_json(CHANGED_FILE, {})
+    dump_json_atomic(CHANGED_FILE, {
+        "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "changed": sorted(set(pending.get("changed", [])) | set(names)),
+    })
+
 def get_excel_files_list(public_link: str, path: str = "/") -> list:
-    url = "https://cloud-api.yandex.net/v1/disk/public/resources"
-    params = {"public_key": public_link, "path": path}
-    resp = requests.get(url, params=params, timeout=30)
-    resp.raise_for_status()
-    data = resp.json()
-    result = []
-    for item in data.get("_embedded", {}).get("items", []):
-        if item.get("type") == "file" and item.get("name", "").endswith((".xlsx", ".xls")):
-            result.append(item)
-        elif item.get("type") == "dir":
-            result.extend(get_excel_files_list(public_link, item.get("path", "")))
-    return result
-
-def download_file(public_link: str, file_path_on_disk: str, local_destination: str):
-    url = "https://cloud-api.yandex.net/v1/disk/public/resources/download"
+    files, complete, failed = list_tree(public_link, path, cache_path=LIST_CACHE_FILE, workers=4, log=log_info)
+    if not complete:
+        raise RuntimeError(f"листинг неполный, ошибок страниц: {len(failed)}")
+    return [f for f in files if f.get("name", "").endswith((".xlsx", ".xls"))]
+
+def download_file(public_link: str, file_path_on_disk: str, local_destination: str, md5: str = None, size: int = None):
     params = {"public_key": public_link, "path": file_path_on_disk}
-    resp = requests.get(url, params=params, timeout=30)
+    resp = CLIENT.api("public/resources/download", params, timeout=30)
     resp.raise_for_status()
     href = resp.json().get("href")
-    with requests.get(href, stream=True, timeout=60) as r:
-        r.raise_for_status()
-        os.makedirs(os.path.dirname(local_destination), exist_ok=True)
-        with open(local_destination, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+    fetch_to_file(CLIENT, href, local_destination, md5=md5, size=size)
 
 def main():
     if not YANDEX_DISK_LINK_PRICES:
@@ -117,18 +144,54 @@ def main():
         log_info("🕑 Запуск обновления прайсов")
         files = get_excel_files_list(YANDEX_DISK_LINK_PRICES)
         log_info(f"🧾 Найдено файлов: {[f.get('name') for f in files]}")
-        ok = 0
-        for item in files:
-            name = item.get("name")
-            local_path = os.path.join(LOCAL_PRICE_DIR, name)
-            try:
-                download_file(YANDEX_DISK_LINK_PRICES, item.get("path"), local_path)
-                log_info(f"✅ Скачан: {name}")
-                ok += 1
-            except Exception as e:
-                log_err(f"⚠️ Ошибка при скачивании {name}: {e}")
-        save_update_time()
-        log_info(f"📦 Прайсы обновлены (успешно: {ok}/{len(files)})")
+        # локально прайсы лежат плоско по имени: одноимённые из разных папок — берём первый по пути,
+        # иначе два потока качают в один и тот же файл
+        by_name = {}
+        for f in sorted(files, key=lambda f: f.get("path") or ""):
+            if f["name"] in by_name:
+                log_err(f"⚠️ Одноимённый прайс пропущен: {f.get('path')} (берём {by_name[f['name']].get('path')})")
+            else:
+                by_name[f["name"]] = f
+        files = list(by_name.values())
+        manifest = load_json(MANIFEST_FILE, {})
+        todo = [f for f in files
+                if is_changed(manifest.get(f["name"]), f) or not os.path.exists(os.path.join(LOCAL_PRICE_DIR, f["name"]))]
+        log_info(f"🔁 Изменено/нет локально: {len(todo)} из {len(files)}")
+
+        done = []
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(DL_WORKERS, len(todo))) as pool:
+                futures = {pool.submit(download_file, YANDEX_DISK_LINK_PRICES, f.get("path"),
+                                       os.path.join(LOCAL_PRICE_DIR, f["name"]),
+                                       md5=f.get("md5"), size=f.get("size")): f for f in todo}
+                for fut in as_completed(futures):
+                    f = futures[fut]
+                    try:
+                        fut.result()
+                        log_info(f"✅ Скачан: {f['name']}")
+                        done.append(f["name"])
+                    except Exception as e:
+                        log_err(f"⚠️ Ошибка при скачивании {f['name']}: {e}")
+
+        # неудачные закачки оставляем со старыми метаданными — повторим в следующий раз
+        fetched = set(done)
+        queued = {f["name"] for f in todo}
+        new_manifest = {}
+        for f in files:
+            meta = {k: f.get(k) for k in ("md5", "size", "modified", "path")}
+            if f["name"] in fetched or f["name"] not in queued:
+                new_manifest[f["name"]] = meta
+            elif f["name"] in manifest:
+                new_manifest[f["name"]] = manifest[f["name"]]
+        dump_json_atomic(MANIFEST_FILE, new_manifest)
+        if done:
+            record_changed(done)
+        if len(done) == len(todo):
+            save_update_time()
+        else:
+            log_err(f"⚠️ Скачано {len(done)} из {len(todo)} — время обновления не сохраняем, повторим при следующем запуске")
+        log_info(f"📦 Прайсы обновлены (скачано: {len(done)}/{len(todo)}, без изменений: {len(files) - len(todo)})")
+        log_info(f"📈 {stats_line()}")
         return 0
     except Exception as e:
         log_err(f"❌ Ошибка в update_prices: {e}")
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import os, re, json, logging
+import os, re, sys, json, time, hashlib, logging
+from itertools import chain, islice
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from catalog import PRICE_KEYS, kop_key, to_kop
+
 try:
     from admin_notify import notify_admin
 except Exception:
@@ -12,6 +17,16 @@ except Exception:
 BASE = os.path.dirname(os.path.abspath(__file__))
 PRICES_DIR = os.path.join(BASE, "data", "prices")
 JSONS_DIR  = os.path.join(BASE, "data", "jsons")
+CHANGED_FILE = os.path.join(BASE, "data", "changed_prices.json")  # очередь от price_cache.py
+MANIFEST_FILE = os.path.join(BASE, "data", "jsons_manifest.json")  # sha1 исходника -> json; неизменённые не конвертируем
+MAPPING_CACHE_FILE = os.path.join(BASE, "data", "mapping_cache.json")  # хэш шапки -> сопоставление колонок
+CONVERTER_VERSION = 3  # поднять при изменении логики конвертации — всё перегенерируется
+WORKERS = int(os.getenv("PRICES_WORKERS", str(min(4, os.cpu_count() or 1))))
+# .xlsx читаются потоково (openpyxl read_only, все листы); PRICES_STREAM=0 — старый путь через pandas (только 1-й лист)
+STREAM_XLSX = os.getenv("PRICES_STREAM", "1") == "1"
+HEADER_SCAN = 60      # строк, в которых ищется шапка (как в find_header_base)
+SAMPLE_ROWS = 500     # строк данных в выборке для определения колонок
+PROFILE_ROWS = int(os.getenv("PRICES_PROFILE_ROWS", "5000"))  # строк для профиля колонок в guess_by_pattern
 LOGS_DIR = os.getenv("LOGS_DIR", "/srv/luckypack/logs")
 os.makedirs(LOGS_DIR, exist_ok=True)
 os.makedirs(LOGS_DIR, exist_ok=True)
@@ -61,55 +76,137 @@ def find_header_base(raw: pd.DataFrame) -> int:
         if raw.iloc[r].notna().any(): return r
     return 0
 
+def flat_names(columns) -> list:
+    if isinstance(columns, pd.MultiIndex):
+        columns = [" ".join([nz(x) for x in t]) for t in columns.to_list()]
+    return [nz(c) for c in columns]
+
 def flatten_columns(df: pd.DataFrame) -> pd.DataFrame:
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = [" ".join([nz(x) for x in t]) for t in df.columns.to_list()]
-    df.columns = [nz(c) for c in df.columns]
+    df.columns = flat_names(df.columns)
     return df
 
-def read_excel_robust(path: str) -> pd.DataFrame:
-    ext = os.path.splitext(path)[1].lower()
-    engine = "openpyxl" if ext == ".xlsx" else None
-    raw = pd.read_excel(path, header=None, dtype=str, engine=engine)
+def _fill_mi_header(row: list, control: list) -> list:
+    """Протяжка объединённых ячеек верхнего уровня вправо — как pandas при header=[...]."""
+    last = row[0]
+    for i in range(1, len(row)):
+        if not control[i]:
+            last = row[i]
+        if row[i] == "":
+            row[i] = last
+        else:
+            control[i] = False
+            last = row[i]
+    return row
+
+def _dedupe(names: list) -> list:
+    """Повторяющиеся имена -> "X", "X.1", "X.2" (как mangle_dupe_cols в pandas)."""
+    seen = {}; out = []
+    for n in names:
+        k = seen.get(n, 0)
+        out.append(n if k == 0 else f"{n}.{k}")
+        seen[n] = k + 1
+    return out
+
+def frame_with_header(raw: pd.DataFrame, rows: list) -> pd.DataFrame:
+    """То же, что pd.read_excel(header=rows), но из уже прочитанного raw (header=None) — без повторного чтения файла."""
+    if rows[-1] >= len(raw):
+        raise ValueError(f"header row {rows[-1]} вне листа")
+    ncol = raw.shape[1]
+    levels = [[nz(v) for v in raw.iloc[r].tolist()] for r in rows]
+    if len(rows) == 1:
+        cols = _dedupe([v or f"Unnamed: {i}" for i, v in enumerate(levels[0])])
+    else:
+        control = [True] * ncol
+        for lvl in levels[:-1]:
+            _fill_mi_header(lvl, control)
+        tuples = [tuple(levels[j][i] or f"Unnamed: {i}_level_{j}" for j in range(len(rows))) for i in range(ncol)]
+        seen = {}; uniq = []
+        for t in tuples:  # повтор целого кортежа — суффикс к нижнему уровню
+            k = seen.get(t, 0)
+            uniq.append(t if k == 0 else t[:-1] + (f"{t[-1]}.{k}",))
+            seen[t] = k + 1
+        cols = pd.MultiIndex.from_tuples(uniq)
+    df = raw.iloc[rows[-1] + 1:].reset_index(drop=True)
+    df.columns = cols
+    return df
+
+def pick_header(raw: pd.DataFrame):
+    """
+    Шапка по уже прочитанному листу (header=None). Возвращает (df, names, start):
+    df — данные с плоскими именами колонок (пустые строки/колонки выкинуты),
+    names — плоские имена по ВСЕМ позициям raw, start — первая строка данных в raw.
+    """
     hdr = find_header_base(raw)
     tried = ([hdr, hdr+1], [hdr+1], [hdr, hdr+1, hdr+2])
-    df_ok = None; last = None
+    last = None
     for header in tried:
         try:
-            tmp = pd.read_excel(path, header=header, dtype=str, engine=engine)
+            full = frame_with_header(raw, header)
         except Exception:
             continue
-        last = tmp
-        tmp = tmp.dropna(how="all")
+        last = (full, header)
+        tmp = full.dropna(how="all")
         if not tmp.empty: tmp = tmp.loc[:, tmp.notna().any()]
         tmp = flatten_columns(tmp)
         cols_norm = [norm(c) for c in tmp.columns]
         if any(any(k in c for k in ["артик","штрих","barcode","ean"]) for c in cols_norm):
-            df_ok = tmp; break
-    if df_ok is None:
-        df_ok = flatten_columns(last if last is not None else pd.read_excel(path, header=None, dtype=str, engine=engine).fillna(""))
-        if list(df_ok.columns) == list(range(len(df_ok.columns))):
-            df_ok.columns = [f"c{i}" for i in range(df_ok.shape[1])]
-    return df_ok
+            return tmp, flat_names(full.columns), header[-1] + 1
+    if last is not None:
+        df_ok, start = flatten_columns(last[0]), last[1][-1] + 1
+    else:
+        df_ok, start = flatten_columns(raw.fillna("")), 0
+    if list(df_ok.columns) == list(range(len(df_ok.columns))):
+        df_ok.columns = [f"c{i}" for i in range(df_ok.shape[1])]
+    return df_ok, list(df_ok.columns), start
+
+def header_row(raw: pd.DataFrame) -> list:
+    """
+    Строка шапки для ключа кэша сопоставлений: та, где есть «артикул» (без заголовка прайса
+    и строк данных — они меняются от файла к файлу). Ячейки: strip, lower, пробелы схлопнуты.
+    """
+    rows = range(min(HEADER_SCAN, len(raw)))
+    hdr = next((r for r in rows if any("артикул" in norm(v) for v in raw.iloc[r].tolist())), None)
+    if hdr is None:
+        hdr = find_header_base(raw)
+    cells = [re.sub(r"\s+", " ", nz(v)).lower() for v in raw.iloc[hdr].tolist()] if len(raw) else []
+    while cells and not cells[-1]:
+        cells.pop()
+    return cells
+
+def read_excel_robust(path: str):
+    """Лист читается один раз (header=None); варианты шапки перебираются на этом же кадре. -> (df, names, header)"""
+    ext = os.path.splitext(path)[1].lower()
+    engine = "openpyxl" if ext == ".xlsx" else None
+    raw = pd.read_excel(path, header=None, dtype=str, engine=engine)
+    df, names, _ = pick_header(raw)
+    return df, names, header_row(raw)
+
+LETTERS_RE = r"[A-Za-zА-Яа-я]"
+NUMERIC_RE = r"\s*[\d\s.,]+\s*"
+
+def _as_text(col: pd.Series) -> pd.Series:
+    """Колонка как строки, пустые — "nan" (как astype(str) в pandas 2)."""
+    return col.fillna("nan").astype(str)
 
 def guess_by_pattern(df: pd.DataFrame) -> dict:
+    """Артикул/наименование по содержимому; профиль колонок — векторно по первым PROFILE_ROWS строкам."""
     m = {}
+    sample = df.head(PROFILE_ROWS)
     # артикул — колонка с макс. EAN-подобных
     best_i, best_cnt = None, -1
-    for c in df.columns:
-        vals = df[c].astype(str).map(lambda s: 1 if EAN_RE.fullmatch(s.strip()) else 0)
-        cnt = int(vals.sum()); 
+    for c in sample.columns:
+        cnt = int(_as_text(sample[c]).str.strip().str.fullmatch(EAN_RE.pattern).sum())
         if cnt > best_cnt: best_cnt, best_i = cnt, c
     if best_i and best_cnt>0: m["Артикул"] = best_i
     # имя — самая «текстовая» (много букв), не цена/не артикул
     longest_i, longest_len = None, -1
-    for c in df.columns:
+    for c in sample.columns:
         if c == m.get("Артикул"): continue
-        s = df[c].astype(str)
-        letters = s.map(lambda x: 1 if re.search(r"[A-Za-zА-Яа-я]", str(x)) else 0).mean()
-        avglen  = s.map(lambda x: len(str(x))).mean()
+        s = _as_text(sample[c])
+        letters = s.str.contains(LETTERS_RE, regex=True).mean()
+        avglen  = s.str.len().mean()
         # не брать чисто числовые столбцы
-        numeric_ratio = s.map(lambda x: 1 if re.fullmatch(r"\s*[\d\s.,]+\s*", str(x) or "") else 0).mean()
+        numeric_ratio = s.str.fullmatch(NUMERIC_RE).mean()
         score = letters*2 + avglen*0.01 - numeric_ratio*2
         if score > longest_len:
             longest_len, longest_i = score, c
@@ -177,6 +274,63 @@ def guess_mapping(df: pd.DataFrame) -> dict:
         m = {**guess_by_pattern(df), **m}
     return m
 
+_MAPPINGS = None  # кэш сопоставлений (грузится один раз на процесс)
+_SEEN = {}        # sig -> новая запись | None (попадание) — отдаётся родителю из convert_one
+
+def header_signature(header) -> str:
+    """Хэш шапки: версия конвертера + нормализованные ячейки строки шапки (см. header_row)."""
+    sig = "\x1f".join([f"v{CONVERTER_VERSION}"] + list(header))
+    return hashlib.sha1(sig.encode("utf-8")).hexdigest()
+
+def load_mapping_cache() -> dict:
+    try:
+        with open(MAPPING_CACHE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def mapping_for(df: pd.DataFrame, names: list, header: list) -> dict:
+    """
+    Сопоставление колонок: знакомая шапка — из кэша, новая — эвристиками guess_mapping.
+    В кэше — позиции колонок листа (индексы в names): имена колонок могут включать
+    текст заголовка прайса, позиции при той же шапке не меняются.
+    """
+    global _MAPPINGS
+    if _MAPPINGS is None:
+        _MAPPINGS = load_mapping_cache()
+    sig = header_signature(header)
+    rec = _MAPPINGS.get(sig)
+    if rec:
+        m = {need: names[i] for need, i in rec["mapping"].items() if isinstance(i, int) and i < len(names)}
+        if len(m) == len(rec["mapping"]) and all(c in df.columns for c in m.values()):
+            _SEEN.setdefault(sig, None)
+            return m
+    m = guess_mapping(df)
+    if "Артикул" in m and "Номенклатура, Характеристика, Упаковка" in m:
+        entry = {"mapping": {need: names.index(col) for need, col in m.items() if col in names},
+                 "columns": list(header)}
+        _MAPPINGS[sig] = entry; _SEEN[sig] = entry
+    return m
+
+def merge_mappings(seen: dict) -> tuple:
+    """Дописывает новые схемы и отметки использования в mapping_cache.json (только в родительском процессе)."""
+    cache = load_mapping_cache(); now = time.strftime("%Y-%m-%d %H:%M:%S")
+    new = hit = 0
+    for sig, entry in seen.items():
+        if entry is not None and sig not in cache:
+            cache[sig] = {**entry, "first_seen": now, "hits": 0}; new += 1
+        elif sig in cache:
+            cache[sig]["hits"] = int(cache[sig].get("hits", 0)) + 1; hit += 1
+        else:
+            continue
+        cache[sig]["last_used"] = now
+    if seen:
+        tmp = MAPPING_CACHE_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, MAPPING_CACHE_FILE)
+    return new, hit
+
 def to_price(x)->str:
     s=nz(x).replace("руб","").replace("rub","").replace(" ", "").replace(",",".")
     try: return f"{float(s):.2f}".replace(".",",")
@@ -199,9 +353,25 @@ def pick_text_from_row(src_row: pd.Series, exclude_cols:set) -> str:
                 best = s
     return best
 
+def pick_text_bulk(src: pd.DataFrame, exclude_cols: set) -> pd.Series:
+    """pick_text_from_row для всех строк src сразу: самое длинное «текстовое» значение, при равенстве — левое."""
+    best = pd.Series("", index=src.index, dtype=object)
+    best_len = pd.Series(0, index=src.index)
+    for col in src.columns:
+        if col in exclude_cols: continue
+        s = src[col].fillna("").astype(str).str.strip()
+        s = s.mask(s.str.lower().isin(["nan", "none"]), "")
+        ok = s.str.contains(LETTERS_RE, regex=True) & ~s.str.fullmatch(NUMERIC_RE)
+        ln = s.str.len().where(ok, 0)
+        take = ln > best_len
+        best = best.mask(take, s); best_len = best_len.mask(take, ln)
+    return best
+
 def process_file(src: str, dst: str)->bool:
-    df = read_excel_robust(src)
-    m = guess_mapping(df)
+    if STREAM_XLSX and src.lower().endswith(".xlsx"):
+        return process_xlsx_stream(src, dst)
+    df, names, header = read_excel_robust(src)
+    m = mapping_for(df, names, header)
     if "Артикул" not in m: raise RuntimeError("Не найден столбец для 'Артикул'")
     if "Номенклатура, Характеристика, Упаковка" not in m: raise RuntimeError("Не найден столбец для 'Номенклатура, Характеристика, Упаковка'")
 
@@ -219,37 +389,228 @@ def process_file(src: str, dst: str)->bool:
             out[pcol] = out[pcol].map(to_price)
 
     # чистим пустые артикула
-    out = filter_rows(out).applymap(nz)
+    out = filter_rows(out).map(nz)
+    # цены ещё и в копейках (int) — потребителям не нужно разбирать строку
+    for pcol in PRICE_KEYS:
+        out[kop_key(pcol)] = pd.Series([to_kop(v) for v in out[pcol]], index=out.index, dtype=object)
 
-    # ФИКС ИМЁН ПО СТРОКЕ: если имя пусто/как артикул/как EAN -> добираем из исходной строки
+    # ФИКС ИМЁН ПО СТРОКЕ: если имя пусто/как артикул/как EAN -> добираем из исходной строки (разом по всем таким строкам)
     name_col = "Номенклатура, Характеристика, Упаковка"
     art_col  = "Артикул"
     exclude = {m.get("Артикул"), m.get("ШТ/КОР"), m.get("ОПТ с НДС"),
                m.get("ОПТ с НДС от 150 000 руб."), m.get("СПЕЦ ЦЕНА")}
-    for i in out.index:
-        name = nz(out.at[i, name_col]); art = nz(out.at[i, art_col])
-        bad = (not name) or (name == art) or bool(EAN_RE.fullmatch(name))
-        if bad:
-            src_row = src_df.loc[i] if i in src_df.index else None
-            cand = pick_text_from_row(src_row, exclude_cols=set([c for c in exclude if c])) if src_row is not None else ""
-            if cand: out.at[i, name_col] = cand
-
-    with open(dst,"w",encoding="utf-8") as f:
-        json.dump(out.to_dict(orient="records"), f, ensure_ascii=False, indent=2)
+    name = out[name_col].astype(str); art = out[art_col].astype(str)
+    bad = (name == "") | (name == art) | name.str.fullmatch(EAN_RE.pattern)
+    idx = out.index[bad & out.index.isin(src_df.index)]
+    if len(idx):
+        cand = pick_text_bulk(src_df.loc[idx], exclude_cols={c for c in exclude if c})
+        cand = cand[cand != ""]
+        out.loc[cand.index, name_col] = cand
+
+    write_json_records(dst, out.to_dict(orient="records"))
     return True
 
+# ---------- потоковый путь для .xlsx ----------
+
+def _cell(v):
+    """Значение ячейки как у pandas с dtype=str: None остаётся пустым, остальное — str."""
+    return None if v is None else str(v)
+
+def iter_xlsx_sheets(path: str):
+    """(имя листа, итератор строк-кортежей) по всем листам; openpyxl read_only — память не растёт с размером файла."""
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            yield ws.title, ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+def iter_sheet_records(rows):
+    """
+    Записи REQUIRED по одному листу. Шапка и колонки определяются на выборке
+    (HEADER_SCAN + SAMPLE_ROWS строк) той же логикой, что и в pandas-пути; дальше строки
+    обрабатываются по одной. None — на листе не нашлось колонок артикула/наименования.
+    """
+    sample = [tuple(_cell(v) for v in r) for r in islice(rows, HEADER_SCAN + SAMPLE_ROWS)]
+    width = max((len(r) for r in sample), default=0)
+    if not width:
+        return None
+    raw = pd.DataFrame([r + (None,) * (width - len(r)) for r in sample], dtype=object)
+    df, names, start = pick_header(raw)
+    m = mapping_for(df, names, header_row(raw))
+    if "Артикул" not in m or "Номенклатура, Характеристика, Упаковка" not in m:
+        return None
+    pos = {need: names.index(col) for need, col in m.items()}
+    exclude = {pos[k] for k in ("Артикул","ШТ/КОР","ОПТ с НДС","ОПТ с НДС от 150 000 руб.","СПЕЦ ЦЕНА") if k in pos}
+    prices = PRICE_KEYS
+
+    def records():
+        rest = (tuple(_cell(v) for v in r) for r in rows)
+        for row in chain(sample[start:], rest):
+            row = row[:width] + (None,) * (width - len(row))
+            rec = {need: nz(row[pos[need]]) if need in pos else "" for need in REQUIRED}
+            if not rec["Артикул"]:
+                continue
+            for pcol in prices:
+                rec[pcol] = nz(to_price(rec[pcol]))
+            for pcol in prices:
+                rec[kop_key(pcol)] = to_kop(rec[pcol])
+            name, art = rec["Номенклатура, Характеристика, Упаковка"], rec["Артикул"]
+            if (not name) or (name == art) or EAN_RE.fullmatch(name):
+                cand = pick_text_from_row(dict(enumerate(row)), exclude_cols=exclude)
+                if cand: rec["Номенклатура, Характеристика, Упаковка"] = cand
+            yield rec
+    return records()
+
+def write_json_records(path: str, records) -> int:
+    """
+    Пишет записи массивом JSON, одна запись — одна строка, отсортированными по «Артикул»
+    (стабильно: дубли — в исходном порядке). _aggregate_products читает такие файлы построчно
+    и сливает без сортировки. До записи в памяти держатся готовые строки, а не записи.
+    """
+    lines = sorted(((rec["Артикул"], json.dumps(rec, ensure_ascii=False)) for rec in records), key=lambda t: t[0])
+    with open(path, "w", encoding="utf-8") as f:
+        for i, (_, line) in enumerate(lines):
+            f.write(("[\n" if i == 0 else ",\n") + line)
+        f.write("\n]" if lines else "[]")
+    return len(lines)
+
+def process_xlsx_stream(src: str, dst: str) -> bool:
+    """Пишет во временный файл; dst подменяется только при успехе — прежний json поставщика не теряется."""
+    sheets = []
+    def all_records():
+        for title, rows in iter_xlsx_sheets(src):
+            recs = iter_sheet_records(rows)
+            if recs is None:
+                continue
+            sheets.append(title)
+            yield from recs
+    tmp = dst + ".tmp"
+    try:
+        n = write_json_records(tmp, all_records())
+        if not sheets:
+            raise RuntimeError("Не найден столбец для 'Артикул' ни на одном листе")
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    logging.info(f"{os.path.basename(src)}: {n} строк, листы: {sheets}")
+    return True
+
+def load_changed() -> list:
+    try:
+        with open(CHANGED_FILE, "r", encoding="utf-8") as f:
+            return list(json.load(f).get("changed", []))
+    except Exception:
+        return []
+
+def ack_changed(names):
+    """
+    Убирает из очереди сконвертированные прайсы и те, чьих xlsx локально уже нет (удалены или
+    переименованы на Диске) — иначе они копятся и перепроверяются каждым --changed.
+    price_cache мог дописать новые — перечитываем.
+    """
+    try:
+        with open(CHANGED_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return
+    names = set(names); queue = data.get("changed", [])
+    data["changed"] = [n for n in queue if n not in names and os.path.exists(os.path.join(PRICES_DIR, n))]
+    gone = len(queue) - len(data["changed"]) - len(names & set(queue))
+    if gone:
+        log(f"🧹 Очередь: убрано прайсов без исходника: {gone}")
+    if data["changed"] == queue:
+        return
+    tmp = CHANGED_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, CHANGED_FILE)
+
+def sha1_file(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_manifest() -> dict:
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_manifest(manifest: dict):
+    tmp = MANIFEST_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, MANIFEST_FILE)
+
+def convert_one(src: str, dst: str):
+    """Воркер пула процессов: (секунды, ошибка | None, использованные схемы колонок)."""
+    t0 = time.monotonic(); _SEEN.clear()
+    try:
+        process_file(src, dst)
+        return time.monotonic() - t0, None, dict(_SEEN)
+    except Exception as e:
+        return time.monotonic() - t0, str(e), dict(_SEEN)
+
 def main():
+    global _MAPPINGS
+    only_changed = "--changed" in sys.argv
+    force = "--force" in sys.argv
     files = [f for f in os.listdir(PRICES_DIR) if f.lower().endswith((".xls",".xlsx")) and not f.startswith("~$")]
-    if not files:
+    if only_changed:
+        queue = set(load_changed())
+        files = [f for f in files if f in queue]
+        if not files:
+            ack_changed([])  # в очереди могли остаться только исчезнувшие исходники
+            log("🛈 --changed: изменённых прайсов нет"); return
+    elif not files:
         msg="❗ Нет Excel-файлов в data/prices"; log(msg,"warning"); notify_admin(msg); return
-    ok=0
+
+    manifest = load_manifest()
+    _MAPPINGS = load_mapping_cache()  # до старта пула — воркеры получат его готовым
+    seen = {}
+    todo = {}; skipped = []
     for fname in files:
         src=os.path.join(PRICES_DIR,fname)
         dst=os.path.join(JSONS_DIR, f"{os.path.splitext(fname)[0]}.json")
-        try:
-            if process_file(src,dst):
-                log(f"✅ {fname} → {os.path.basename(dst)}"); ok+=1
-        except Exception as e:
-            log(f"❌ Ошибка конвертации {fname}: {e}", "error"); notify_admin(f"{fname}: {e}")
-    log(f"🏁 Готово. Успешно: {ok} из {len(files)}")
+        digest = sha1_file(src)
+        rec = manifest.get(fname) or {}
+        if (not force and rec.get("sha1") == digest and rec.get("version") == CONVERTER_VERSION
+                and os.path.exists(dst)):
+            skipped.append(fname); continue
+        todo[fname] = (src, dst, digest)
+    if skipped:
+        log(f"⏭ Без изменений: {len(skipped)}")
+
+    ok=0; done=list(skipped); t0 = time.monotonic()
+    if todo:
+        with ProcessPoolExecutor(max_workers=max(1, min(WORKERS, len(todo)))) as pool:
+            futures = {pool.submit(convert_one, src, dst): fname for fname, (src, dst, _) in todo.items()}
+            for fut in as_completed(futures):
+                fname = futures[fut]
+                src, dst, digest = todo[fname]
+                try:
+                    dt, err, used = fut.result()
+                except Exception as e:  # упал сам воркер
+                    dt, err, used = 0.0, str(e), {}
+                for sig, entry in used.items():
+                    if entry is not None or sig not in seen:
+                        seen[sig] = entry
+                if err:
+                    log(f"❌ Ошибка конвертации {fname} ({dt:.2f} с): {err}", "error"); notify_admin(f"{fname}: {err}")
+                    continue
+                log(f"✅ {fname} → {os.path.basename(dst)} ({dt:.2f} с)"); ok+=1; done.append(fname)
+                manifest[fname] = {"sha1": digest, "json": os.path.basename(dst), "version": CONVERTER_VERSION,
+                                   "seconds": round(dt, 3), "converted": time.strftime("%Y-%m-%d %H:%M:%S")}
+        save_manifest(manifest)
+        new, hit = merge_mappings(seen)
+        log(f"🗂 Схемы колонок: из кэша {hit}, новых {new}")
+    ack_changed(done)
+    log(f"🏁 Готово. Сконвертировано: {ok} из {len(todo)}, без изменений: {len(skipped)}, "
+        f"за {time.monotonic() - t0:.1f} с (процессов: {min(WORKERS, len(todo)) if todo else 0})")
 if __name__=="__main__": main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Кэш сопоставлений колонок: та же шапка при другом заголовке прайса и других данных — попадание."""
+import os, sys, json
+
+import pytest
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import prices_to_json as ptj
+
+HEADER = ["Артикул", "Номенклатура, Характеристика, Упаковка", "ШТ/КОР",
+          "ОПТ с НДС", "ОПТ с НДС от 150 000 руб.", "СПЕЦ ЦЕНА"]
+
+def make_xlsx(path, title, rows):
+    wb = openpyxl.Workbook(); ws = wb.active
+    ws.append([title])
+    ws.append(HEADER)
+    for r in rows:
+        ws.append(r)
+    wb.save(path)
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ptj, "MAPPING_CACHE_FILE", str(tmp_path / "mapping_cache.json"))
+    monkeypatch.setattr(ptj, "_MAPPINGS", None)
+    ptj._SEEN.clear()
+    yield tmp_path
+    ptj._SEEN.clear()
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_same_header_other_title_and_rows_is_hit(cache, monkeypatch, stream):
+    monkeypatch.setattr(ptj, "STREAM_XLSX", stream)
+    a, b = cache / "a.xlsx", cache / "b.xlsx"
+    make_xlsx(a, "Прайс-лист ООО Ромашка от 01.10.2026",
+              [["4600000948525", "Товар 0", "10", "100,50", "95", "90"],
+               ["4600000948526", "Товар 1", "20", "80", "75", "70"]])
+    make_xlsx(b, "Прайс-лист ООО Ромашка от 02.10.2026",
+              [["A-77", "Пакет фасовочный", "500", "12,30", "11", ""],
+               ["A-78", "Пакет майка", "250", "20", "19", "18"]])
+
+    assert ptj.process_file(str(a), str(cache / "a.json"))
+    first = dict(ptj._SEEN)
+    assert len(first) == 1 and list(first.values())[0] is not None  # новая схема
+    ptj.merge_mappings(first)
+
+    monkeypatch.setattr(ptj, "_MAPPINGS", None); ptj._SEEN.clear()
+    assert ptj.process_file(str(b), str(cache / "b.json"))
+    assert ptj._SEEN == {list(first)[0]: None}  # та же шапка — из кэша
+
+    with open(cache / "b.json", encoding="utf-8") as f:
+        recs = json.load(f)
+    assert [r["Артикул"] for r in recs] == ["A-77", "A-78"]
+    assert recs[0]["Номенклатура, Характеристика, Упаковка"] == "Пакет фасовочный"
+    assert recs[1]["СПЕЦ ЦЕНА"] == "18,00"
@@ -4,9 +4,18 @@ build_image_index.py — построение CLIP-индекса для изо
 • Читает photos_index.json + products.json, отбирает артикулы с картинками.
 • Кодирует в эмбеддинги (open-clip), нормализует, пишет FAISS: AI/embeddings/faiss_img.index.
 • Сохраняет маппинги: img_ids.npy (артикулы), img_lab.npy (средний Lab-цвет).
+• update_index(arts) — инкрементальное обновление: перекодирует только указанные артикулы
+  (используется image_opt.py --watch), остальные векторы берутся из текущего индекса.
+• --missing — доиндексировать только VALID = (CANDIDATES ∩ PRODUCTS) \ INDEXED из sync_planner.plan()
+  (план считается в этом же процессе, без tools/list_*.py).
+• Публикация: три файла одного поколения пишутся в index/img.<версия>/, затем симлинк
+  index/img_current переключается на него одним rename. index/faiss_img.index, img_ids.npy,
+  img_lab.npy — симлинки через img_current (для старых читателей); кто читает больше одного
+  файла — резолвит img_current один раз (current_dir()). Обновления идут под блокировкой.
 Требует: open-clip-torch, faiss-cpu, torch (CPU).
 """
-import json, os, numpy as np, faiss, torch, open_clip
+import json, os, sys, time, shutil, fcntl, tempfile, numpy as np, faiss, torch, open_clip
+from contextlib import contextmanager
 from pathlib import Path
 from PIL import Image
 
@@ -17,6 +26,12 @@ P_IDX = DATA/"photos_index.json"                    # индекс фоток (
 P_PROD= PROJ/"LuckyPricer/products.json"           # товары (с «Артикул»)
 DOUT  = PROJ/"SearchByPhoto/index"                       # сюда сложим faiss и *.npy
 DOUT.mkdir(parents=True, exist_ok=True)
+CURRENT = DOUT/"img_current"                            # симлинк на img.<версия>/ — текущее поколение
+FILES = ("faiss_img.index", "img_ids.npy", "img_lab.npy")
+LOCK = DOUT/".img_index.lock"
+KEEP_VERSIONS = 2                                       # текущее + предыдущее (его могут дочитывать)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]/"LuckyPricer"))
+import catalog                                          # products.sqlite, если свежее products.json
 
 # Модель — лёгкая
 MODEL="ViT-B-32"
@@ -24,10 +39,19 @@ PRETRAINED="laion2b_s34b_b79k"
 DEVICE="cpu"
 BATCH=int(os.getenv("IMG_BATCH","32"))
 
-def load_lists():
+_MODEL = None  # (model, preprocess) — кэш модели для долгоживущих процессов (watch-режим)
+
+def _get_model():
+    global _MODEL
+    if _MODEL is None:
+        model, _, preprocess = open_clip.create_model_and_transforms(MODEL, pretrained=PRETRAINED, device=DEVICE)
+        model.eval()
+        _MODEL = (model, preprocess)
+    return _MODEL
+
+def load_lists(only=None):
     # товары
-    prod = json.load(open(P_PROD, "r", encoding="utf-8"))
-    arts = { str(r.get("Артикул","")).strip() for r in prod if str(r.get("Артикул","")).strip() }
+    arts = catalog.articles(P_PROD.with_suffix(".sqlite"), P_PROD)
     # индекс фото
     pidx = json.load(open(P_IDX, "r", encoding="utf-8"))
     # берём только те записи, где ключ совпадает с артикулом и есть файл
@@ -35,6 +59,8 @@ def load_lists():
     misses_art=0; misses_file=0
     for key, rec in pidx.items():
         art = str(key).strip()
+        if only is not None and art not in only:
+            continue
         if art not in arts:
             misses_art += 1
             continue
@@ -47,7 +73,7 @@ def load_lists():
     return items, misses_art, misses_file
 
 def encode_paths(items, batch=BATCH):
-    model, _, preprocess = open_clip.create_model_and_transforms(MODEL, pretrained=PRETRAINED, device=DEVICE)
+    model, preprocess = _get_model()
     ids, labs, embs = [], [], []
     def flush(buf_imgs, buf_ids, buf_labs):
         if not buf_imgs: return
@@ -68,7 +94,84 @@ def encode_paths(items, batch=BATCH):
     L = np.vstack(labs) if labs else np.zeros((0,3), dtype=np.float32)
     return E, I, L
 
+@contextmanager
+def index_lock():
+    """Одно обновление индекса за раз (--watch, --changes, ночной --missing)."""
+    with open(LOCK, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try: yield
+        finally: fcntl.flock(f, fcntl.LOCK_UN)
+
+def current_dir() -> Path:
+    """Каталог текущего поколения; до первой публикации — сам DOUT (файлы старого формата)."""
+    return CURRENT.resolve() if CURRENT.exists() else DOUT
+
+def _swap_link(link: Path, target: str):
+    tmp = link.with_name(f".{link.name}.tmp")
+    tmp.unlink(missing_ok=True)
+    os.symlink(target, tmp)
+    os.replace(tmp, link)
+
+def _save(index, I, L):
+    # поколение целиком в новый каталог, затем одно переключение симлинка —
+    # читатель не увидит новые ids со старым faiss и полузаписанные файлы
+    ver = Path(tempfile.mkdtemp(prefix=f"img.{time.strftime('%Y%m%d-%H%M%S')}.", dir=DOUT))
+    ver.chmod(0o755)
+    faiss.write_index(index, str(ver/"faiss_img.index"))
+    np.save(ver/"img_ids.npy", I)
+    np.save(ver/"img_lab.npy", L)
+    _swap_link(CURRENT, ver.name)
+    for name in FILES:
+        if not (DOUT/name).is_symlink():
+            _swap_link(DOUT/name, f"{CURRENT.name}/{name}")
+    for old in sorted(DOUT.glob("img.*"), key=lambda p: p.stat().st_mtime)[:-KEEP_VERSIONS]:
+        if old != ver:
+            shutil.rmtree(old, ignore_errors=True)
+
+def update_index(arts):
+    """
+    Инкрементально обновляет image-индекс для артикулов arts (новые или изменённые фото).
+    Старые векторы этих артикулов выбрасываются, остальные переносятся без перекодирования.
+    Если индекса ещё нет — строится полный.
+    """
+    arts = {str(a).strip() for a in arts if str(a).strip()}
+    if not arts: return 0
+    with index_lock():
+        return _update_locked(arts)
+
+def _update_locked(arts):
+    cur = current_dir()
+    p_index, p_ids, p_lab = (cur/name for name in FILES)
+    if not (p_index.exists() and p_ids.exists() and p_lab.exists()):
+        _build_locked(); return len(arts)
+
+    old = faiss.read_index(str(p_index))
+    old_ids = [x.decode("utf-8","ignore") if isinstance(x,(bytes,bytearray)) else str(x)
+               for x in np.load(p_ids, allow_pickle=True)]
+    old_lab = np.load(p_lab)
+    keep = [i for i, a in enumerate(old_ids) if a not in arts]
+    E_old = old.reconstruct_n(0, old.ntotal)[keep] if old.ntotal else np.zeros((0, old.d), dtype=np.float32)
+
+    items, _, _ = load_lists(only=arts)
+    if items:
+        E_new, I_new, L_new = encode_paths(items)
+    else:  # только удаления — модель не грузим
+        E_new, I_new, L_new = np.zeros((0, old.d), dtype=np.float32), np.array([], dtype=object), np.zeros((0,3), dtype=np.float32)
+
+    index = faiss.IndexFlatIP(old.d)
+    if len(E_old): index.add(np.ascontiguousarray(E_old, dtype=np.float32))
+    if len(E_new): index.add(E_new)
+    I = np.concatenate([np.array([old_ids[i] for i in keep], dtype=object), I_new])
+    L = np.vstack([old_lab[keep].reshape(-1,3), L_new.reshape(-1,3)]).astype(np.float32)
+    _save(index, I, L)
+    print(f"OK: image-индекс обновлён: +{len(I_new)} (запрошено {len(arts)}), всего векторов: {index.ntotal}", flush=True)
+    return len(I_new)
+
 def main():
+    with index_lock():
+        _build_locked()
+
+def _build_locked():
     if not P_IDX.exists(): raise SystemExit(f"Нет {P_IDX}, сперва запусти image_opt.py")
     if not P_PROD.exists(): raise SystemExit(f"Нет {P_PROD}")
     items, miss_art, miss_file = load_lists()
@@ -79,12 +182,23 @@ def main():
     index = faiss.IndexFlatIP(E.shape[1]); index.add(E)
 
     # Сохраняем
-    faiss.write_index(index, str(DOUT/"faiss_img.index"))
-    np.save(DOUT/"img_ids.npy", I)
-    np.save(DOUT/"img_lab.npy", L)
+    _save(index, I, L)
 
     print(f"OK: image-индекс построен. Векторов: {index.ntotal}")
-    print("Файлы:", DOUT/"faiss_img.index", DOUT/"img_ids.npy", DOUT/"img_lab.npy")
+    print("Файлы:", *(current_dir()/name for name in FILES))
+
+def index_missing():
+    """Доиндексация по плану sync_planner: только фото, которых ещё нет в индексе."""
+    from sync_planner import plan
+    p = plan(vect=str(DATA/"vectorized"), prod=str(P_PROD), ids=str(current_dir()/"img_ids.npy"))
+    print(f"План: candidates {len(p['candidates'] or ())}, products {len(p['products'])}, "
+          f"indexed {len(p['indexed'])}, valid {len(p['valid'])}", flush=True)
+    if not p["valid"]:
+        print("OK: доиндексировать нечего"); return 0
+    return update_index(str(k) for k in p["valid"])
 
 if __name__ == "__main__":
-    main()
+    if "--missing" in sys.argv:
+        index_missing()
+    else:
+        main()
@@ -1,15 +1,18 @@
 #!/usr/bin/env python3
 """
 build_text_index.py — построение CLIP-индекса для текстов.
-• Читает LuckyPricer/products.json (Артикул, Наименование, Категория).
+• Читает LuckyPricer/products.json (Артикул, Наименование, Категория) — через каталог products.sqlite, если он свежий.
 • Кодирует тексты (open-clip), пишет FAISS: AI/embeddings/faiss_txt.index + txt_ids.npy/txt_cats.npy.
 Требует: open-clip-torch, faiss-cpu, torch (CPU).
 """
-import json, os, numpy as np, faiss, torch, open_clip
+import os, sys, numpy as np, faiss, torch, open_clip
 from pathlib import Path
 
 ROOT = Path("/srv/luckypack/project")
 PROD = ROOT/"LuckyPricer/products.json"
+PROD_DB = ROOT/"LuckyPricer/products.sqlite"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]/"LuckyPricer"))
+import catalog
 DOUT = ROOT/"AI/embeddings"
 DOUT.mkdir(parents=True, exist_ok=True)
 
@@ -22,9 +25,8 @@ BATCH=int(os.getenv("TXT_BATCH","64"))
 def load_products():
     if not PROD.exists():
         raise SystemExit(f"Нет файла: {PROD}")
-    data = json.load(open(PROD, "r", encoding="utf-8"))
     items=[]
-    for it in data:
+    for it in catalog.records(PROD_DB, PROD):
         art = str(it.get("Артикул","")).strip()
         name = str(it.get("Наименование","")).strip()
         cat  = str(it.get("Категория","")).strip()
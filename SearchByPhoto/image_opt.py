@@ -4,9 +4,28 @@ image_opt.py — нормализация фотобазы.
 • Берёт новые файлы из data/photos/original/, валидирует EAN, считает хеш.
 • Делает ресайз (MAX_DIM, по умолчанию 1600), конвертирует в WebP (WEBP_QUALITY), создаёт thumbs/.
 • Обновляет data/photos/photos_index.json. Идемпотентно (повторный запуск не трогает обработанные).
+• --watch: демон на inotify — ловит новые/изменённые файлы в original/, гасит «пачки» событий
+  (WATCH_DEBOUNCE сек тишины, но не дольше WATCH_MAX_DELAY), сразу оптимизирует их
+  и инкрементально дообновляет image-индекс (build_image_index.update_index).
+• Производные картинки хранятся один раз на содержимое: store/<вид>/<ab>/<sha1>.webp,
+  а vectorized/<артикул>.webp и thumbs/<артикул>.webp — жёсткие ссылки на них
+  (если ссылку сделать нельзя — копия). Одинаковые фото под разными EAN кодируются один раз.
+• Готовые рендишены для выдачи: tg/<артикул>.jpg (JPEG для альбома в Telegram)
+  и xlsx/<артикул>.png (PNG 90px для картинок в Excel) — запросы только читают готовые байты.
+• Профили WebP: fast (method=WEBP_FAST_METHOD, по умолчанию 1) — при приёме, чтобы фото
+  быстро становились доступными для поиска; compact (method=6) — плотнее, но медленнее.
+  Профиль приёма — WEBP_PROFILE; --recompress (низкий приоритет, nice 19) перекодирует
+  всё, что принято в fast, в compact. По каждому профилю печатаются байты и секунды.
+• --changes FILE: обработать ровно набор изменений от LuckyDownloader/sync_photos_guarded.py
+  (changed — пути оригиналов, deleted — EAN, у которых убираются производные и запись индекса).
+• --dedup: переносит уже существующие производные в store и удаляет объекты без ссылок.
+• photos_index.json пишут несколько процессов (ночной проход, --watch, --changes, --recompress,
+  --dedup): сохранение идёт под файловой блокировкой и сливает в свежую версию файла только
+  записи, изменённые этим процессом, — чужие изменения не затираются.
 Логи: /srv/luckypack/logs/photos.log; пути настраиваются через .env.
 """
-import os, json, hashlib, io, sys
+import os, json, hashlib, io, sys, time, argparse, shutil, fcntl
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 from PIL import Image
@@ -17,14 +36,29 @@ DATA_PHOTOS = Path("/app/data/photos")
 D_ORIG = DATA_PHOTOS/"original"
 D_VECT = DATA_PHOTOS/"vectorized"
 D_THMB = DATA_PHOTOS/"thumbs"
+D_TG   = DATA_PHOTOS/"tg"    # JPEG для Telegram
+D_XLSX = DATA_PHOTOS/"xlsx"  # PNG для Excel
+D_STORE = DATA_PHOTOS/"store"  # контентно-адресуемое хранилище производных (ключ — sha1 оригинала)
 INDEX  = DATA_PHOTOS/"photos_index.json"
+INDEX_LOCK = DATA_PHOTOS/".photos_index.lock"
 
 MAX_DIM = int(os.getenv("MAX_DIM", "1600"))
 WEBP_Q  = int(os.getenv("WEBP_QUALITY", "80"))
 THUMB   = 512
+WEBP_PROFILES = {
+    "fast":    {"method": int(os.getenv("WEBP_FAST_METHOD", "1"))},
+    "compact": {"method": 6},
+}
+WEBP_PROFILE = os.getenv("WEBP_PROFILE", "fast")  # профиль при приёме новых фото
+TG_JPEG_Q = int(os.getenv("TG_JPEG_QUALITY", "85"))
+XLSX_PX   = 90  # build_excel всё равно ужимает картинку до 90px
+STORE_GC_GRACE = 3600  # --dedup не удаляет объекты store моложе часа
 SAVE_EVERY = 50  # автосейв индекса каждые N файлов
+PHOTO_EXT = (".jpg",".jpeg",".png",".webp")
+WATCH_DEBOUNCE  = float(os.getenv("WATCH_DEBOUNCE", "5"))    # сек тишины перед обработкой пачки
+WATCH_MAX_DELAY = float(os.getenv("WATCH_MAX_DELAY", "30"))  # но не дольше N сек от первого события
 
-for d in (D_VECT, D_THMB, INDEX.parent):
+for d in (D_VECT, D_THMB, D_TG, D_XLSX, D_STORE, INDEX.parent):
     d.mkdir(parents=True, exist_ok=True)
 
 def sha1_bytes(b: bytes)->str:
@@ -37,22 +71,187 @@ def avg_lab(im: Image.Image):
     L = float(np.mean(lab[...,0])); a = float(np.mean(lab[...,1])); b = float(np.mean(lab[...,2]))
     return [round(L,3), round(a,3), round(b,3)]
 
-def read_index():
+_SEEN = {}  # артикул → запись (json) в том виде, как этот процесс её прочитал/сохранил
+
+@contextmanager
+def index_lock():
+    with open(INDEX_LOCK, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try: yield
+        finally: fcntl.flock(f, fcntl.LOCK_UN)
+
+def _load_index_file():
     if INDEX.exists():
         try: return json.load(open(INDEX, "r", encoding="utf-8"))
         except: return {}
     return {}
 
+def _remember(idx):
+    _SEEN.clear()
+    _SEEN.update((k, json.dumps(v, ensure_ascii=False, sort_keys=True)) for k, v in idx.items())
+
+def read_index():
+    idx = _load_index_file()
+    _remember(idx)
+    return idx
+
+def reload_index(idx):
+    """Подтягивает в idx свежую версию файла (несохранённые изменения теряются — зовём после save_index)."""
+    idx.clear(); idx.update(read_index())
+
 def save_index(idx):
-    tmp = INDEX.with_suffix(".tmp.json")
-    json.dump(idx, open(tmp, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
-    tmp.replace(INDEX)
+    """
+    Под блокировкой перечитывает файл и применяет только свои изменения относительно _SEEN:
+    изменённые/новые записи, удалённые артикулы. Затем idx = итоговое состояние файла.
+    """
+    with index_lock():
+        cur = _load_index_file()
+        for art, rec in idx.items():
+            if _SEEN.get(art) != json.dumps(rec, ensure_ascii=False, sort_keys=True):
+                cur[art] = rec
+        for art in _SEEN.keys() - idx.keys():
+            cur.pop(art, None)
+        tmp = INDEX.with_suffix(".tmp.json")
+        json.dump(cur, open(tmp, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
+        tmp.replace(INDEX)
+    idx.clear(); idx.update(cur)
+    _remember(idx)
+
+def store_path(kind: str, sha1: str, ext: str = ".webp") -> Path:
+    return D_STORE/kind/sha1[:2]/f"{sha1}{ext}"
+
+def save_into_store(im: Image.Image, obj: Path, fmt: str, **params):
+    """Атомарная запись объекта хранилища: во временный файл и rename."""
+    obj.parent.mkdir(parents=True, exist_ok=True)
+    tmp = obj.with_name(f".{obj.name}.tmp")
+    im.save(tmp, fmt, **params)
+    tmp.replace(obj)
+
+def link_into(obj: Path, dst: Path):
+    """Публикует объект хранилища под именем артикула: hardlink, а если нельзя (другой раздел) — копия."""
+    if dst.exists() and os.path.samefile(obj, dst):
+        return
+    tmp = dst.with_name(f".{dst.name}.tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(obj, tmp)
+    except OSError:
+        shutil.copy2(obj, tmp)
+    tmp.replace(dst)
+
+ENC_STATS = {}  # профиль → {"files", "bytes", "seconds"} за этот запуск
+
+def encode_webp(im: Image.Image, obj: Path, profile: str):
+    t0 = time.perf_counter()
+    save_into_store(im, obj, "WEBP", quality=WEBP_Q, **WEBP_PROFILES[profile])
+    st = ENC_STATS.setdefault(profile, {"files": 0, "bytes": 0, "seconds": 0.0})
+    st["files"] += 1; st["bytes"] += obj.stat().st_size; st["seconds"] += time.perf_counter() - t0
+
+def print_enc_stats():
+    for name, st in ENC_STATS.items():
+        n = st["files"] or 1
+        print(f"WEBP {name}: файлов {st['files']}, {st['bytes']/1024:.0f} КБ ({st['bytes']/n/1024:.1f} КБ/файл), "
+              f"{st['seconds']:.1f} с ({st['seconds']/n*1000:.0f} мс/файл)", flush=True)
+
+def derive(raw: bytes):
+    """Оригинал → (ресайз до MAX_DIM, превью до THUMB)."""
+    im = Image.open(io.BytesIO(raw)).convert("RGB")
+    w,h = im.size
+    scale = min(1.0, MAX_DIM/max(w,h))
+    im_res = im.resize((int(w*scale), int(h*scale)), Image.LANCZOS) if scale<1.0 else im
+
+    im_th = im_res.copy()
+    tw,th = im_th.size
+    if max(tw,th)>THUMB:
+        s = THUMB/max(tw,th)
+        im_th = im_th.resize((int(tw*s), int(th*s)), Image.LANCZOS)
+    return im_res, im_th
+
+def add_renditions(art: str, rec: dict, im_th: Image.Image):
+    """Рендишены для выдачи (из превью): Telegram JPEG и Excel PNG; пишутся в store и линкуются по артикулу."""
+    sha1 = rec["sha1"]
+    tg_obj, xl_obj = store_path("tg", sha1, ".jpg"), store_path("xlsx", sha1, ".png")
+    if not tg_obj.exists():
+        save_into_store(im_th.convert("RGB"), tg_obj, "JPEG", quality=TG_JPEG_Q, optimize=True)
+    if not xl_obj.exists():
+        im_x = im_th.convert("RGBA")
+        im_x.thumbnail((XLSX_PX, XLSX_PX), Image.LANCZOS)
+        save_into_store(im_x, xl_obj, "PNG", optimize=True)
+    tg_path, xl_path = D_TG/f"{art}.jpg", D_XLSX/f"{art}.png"
+    link_into(tg_obj, tg_path)
+    link_into(xl_obj, xl_path)
+    rec["tg"], rec["xlsx"] = str(tg_path), str(xl_path)
+
+def has_renditions(rec: dict) -> bool:
+    return all(rec.get(k) and Path(rec[k]).exists() for k in ("tg", "xlsx"))
+
+def sha_map(idx: dict) -> dict:
+    """sha1 → запись индекса (для переиспользования уже посчитанных w/h/avg_lab)."""
+    return {r["sha1"]: r for r in idx.values() if isinstance(r, dict) and r.get("sha1")}
 
 def iter_photos():
     for p in sorted(D_ORIG.glob("**/*")):
-        if p.is_file() and p.suffix.lower() in (".jpg",".jpeg",".png",".webp"):
+        if p.is_file() and p.suffix.lower() in PHOTO_EXT:
             yield p
 
+def article_of(p: Path) -> str:
+    return p.stem.split(" (")[0].strip()
+
+def process_photo(p: Path, idx: dict, by_sha: dict = None):
+    """
+    Обрабатывает один файл из original/ и обновляет запись в idx.
+    Возвращает артикул, если файл (пере)обработан, и None, если он не менялся.
+    by_sha — sha_map(idx), чтобы не строить его на каждый файл в пакетном режиме.
+    """
+    clean_base = article_of(p)
+
+    raw = p.read_bytes()
+    sha1 = sha1_bytes(raw)
+
+    rec = idx.get(clean_base)
+    if rec and rec.get("sha1")==sha1 and Path(rec.get("vectorized","")).exists() and Path(rec.get("thumb","")).exists():
+        if not has_renditions(rec):
+            # обработан до появления рендишенов — досоздаём из готового превью
+            with Image.open(rec["thumb"]) as im_th:
+                add_renditions(clean_base, rec, im_th)
+        return None  # уже обработан
+
+    if by_sha is None:
+        by_sha = sha_map(idx)
+    vect_obj, thumb_obj = store_path("vectorized", sha1), store_path("thumbs", sha1)
+    twin = by_sha.get(sha1)
+
+    if twin and vect_obj.exists() and thumb_obj.exists():
+        # такое же фото уже обработано (под другим EAN или раньше) — только ссылки
+        size, lab = (twin["w"], twin["h"]), twin["avg_lab"]
+        profile = twin.get("profile", "compact")
+        with Image.open(thumb_obj) as im:
+            im_th = im.copy()  # превью маленькое — держим в памяти, файл закрываем сразу
+    else:
+        im_res, im_th = derive(raw)
+        profile = WEBP_PROFILE
+        encode_webp(im_res, vect_obj, profile)
+        encode_webp(im_th, thumb_obj, profile)
+        size, lab = im_res.size, avg_lab(im_res)
+
+    vect_path = (D_VECT/f"{clean_base}.webp")
+    thumb_path = (D_THMB/f"{clean_base}.webp")
+    link_into(vect_obj, vect_path)
+    link_into(thumb_obj, thumb_path)
+
+    rec = idx[clean_base] = by_sha[sha1] = {
+        "original": str(p),
+        "vectorized": str(vect_path),
+        "thumb": str(thumb_path),
+        "w": size[0], "h": size[1],
+        "sha1": sha1,
+        "avg_lab": lab,
+        "profile": profile,
+        "updated": datetime.now().isoformat(timespec="seconds")
+    }
+    add_renditions(clean_base, rec, im_th)
+    return clean_base
+
 def main():
     files = list(iter_photos())
     total = len(files)
@@ -60,51 +259,17 @@ def main():
         print("Нет файлов в original/", flush=True); return
 
     idx = read_index()
+    by_sha = sha_map(idx)
     processed = 0
     saved = 0
 
     try:
         for i, p in enumerate(files, start=1):
-            base = p.stem
-            clean_base = base.split(" (")[0].strip()
-
-            raw = p.read_bytes()
-            sha1 = sha1_bytes(raw)
-
-            rec = idx.get(clean_base)
-            if rec and rec.get("sha1")==sha1 and Path(rec.get("vectorized","")).exists() and Path(rec.get("thumb","")).exists():
-                # уже обработан
+            if process_photo(p, idx, by_sha) is None:
                 if i % 100 == 0:
-                    print(f"[{i}/{total}] пропущено (уже есть): {clean_base}", flush=True)
+                    print(f"[{i}/{total}] пропущено (уже есть): {article_of(p)}", flush=True)
                 continue
 
-            im = Image.open(io.BytesIO(raw)).convert("RGB")
-            w,h = im.size
-            scale = min(1.0, MAX_DIM/max(w,h))
-            im_res = im.resize((int(w*scale), int(h*scale)), Image.LANCZOS) if scale<1.0 else im
-
-            vect_path = (D_VECT/f"{clean_base}.webp")
-            im_res.save(vect_path, "WEBP", quality=WEBP_Q, method=6)
-
-            im_th = im_res.copy()
-            tw,th = im_th.size
-            if max(tw,th)>THUMB:
-                s = THUMB/max(tw,th)
-                im_th = im_th.resize((int(tw*s), int(th*s)), Image.LANCZOS)
-            thumb_path = (D_THMB/f"{clean_base}.webp")
-            im_th.save(thumb_path, "WEBP", quality=WEBP_Q, method=6)
-
-            lab = avg_lab(im_res)
-
-            idx[clean_base] = {
-                "original": str(p),
-                "vectorized": str(vect_path),
-                "thumb": str(thumb_path),
-                "w": im_res.size[0], "h": im_res.size[1],
-                "sha1": sha1,
-                "avg_lab": lab,
-                "updated": datetime.now().isoformat(timespec="seconds")
-            }
             processed += 1
             if processed % SAVE_EVERY == 0:
                 save_index(idx); saved += 1
@@ -115,6 +280,7 @@ def main():
         # финальный сейв
         save_index(idx)
         print(f"OK: обработано новых файлов: {processed}, всего записей в индексе: {len(idx)}", flush=True)
+        print_enc_stats()
 
     except KeyboardInterrupt:
         # сейв при прерывании руками
@@ -122,5 +288,211 @@ def main():
         print(f"\nINTERRUPTED: автосейв индекса. Готово записей: {len(idx)}, обработано новых: {processed}", flush=True)
         sys.exit(130)
 
+def update_embeddings(arts):
+    """Инкрементально дообновляет image-индекс; тяжёлые импорты (torch/faiss) — только здесь."""
+    if not arts: return
+    try:
+        import build_image_index
+        build_image_index.update_index(arts)
+    except SystemExit as e:
+        print(f"WARN: индекс не обновлён: {e}", flush=True)
+    except Exception as e:
+        print(f"ERROR: инкрементальное обновление индекса: {e}", flush=True)
+
+def process_batch(paths, idx):
+    done = []
+    by_sha = sha_map(idx)
+    for p in sorted(paths):
+        if not (p.is_file() and p.suffix.lower() in PHOTO_EXT):
+            continue
+        try:
+            art = process_photo(p, idx, by_sha)
+        except Exception as e:
+            print(f"ERROR: {p.name}: {e}", flush=True); continue
+        if art: done.append(art)
+    if paths:
+        save_index(idx)  # даже без новых фото могли досоздаться рендишены
+    if done:
+        print(f"[batch] обработано: {len(done)} — {', '.join(done[:10])}", flush=True)
+        update_embeddings(done)
+    return done
+
+def forget(art: str, idx: dict) -> bool:
+    """Убирает производные артикула (ссылки; объекты store подчистит --dedup) и его запись в индексе."""
+    rec = idx.pop(art, None)
+    if not isinstance(rec, dict): return False
+    for key in ("vectorized", "thumb", "tg", "xlsx"):
+        if rec.get(key):
+            Path(rec[key]).unlink(missing_ok=True)
+    return True
+
+def apply_changes(path: Path):
+    """
+    Применяет очередь изменений от дельта-синка: changed — обработать, deleted — забыть.
+    Обработанная очередь удаляется; при ошибке чтения ничего не трогаем.
+    """
+    try:
+        ch = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        print(f"Нет изменений: {path}", flush=True); return
+    idx = read_index()
+    removed = [a for a in ch.get("deleted", []) if forget(str(a), idx)]
+    if removed:
+        save_index(idx)
+        print(f"[changes] удалено: {len(removed)} — {', '.join(removed[:10])}", flush=True)
+    done = process_batch([Path(p) for p in ch.get("changed", [])], idx)
+    update_embeddings(removed)  # векторы удалённых уходят из индекса (фото для них больше нет)
+    path.unlink(missing_ok=True)
+    print(f"OK: изменения применены: обработано {len(done)}, удалено {len(removed)}", flush=True)
+    print_enc_stats()
+
+def watch():
+    from inotify_simple import INotify, flags
+
+    inotify = INotify()
+    file_mask = flags.CLOSE_WRITE | flags.MOVED_TO
+    dir_mask  = file_mask | flags.CREATE
+    wds = {}
+
+    def add_tree(root: Path):
+        for d in [root, *[p for p in root.glob("**/*") if p.is_dir()]]:
+            try:
+                wds[inotify.add_watch(str(d), dir_mask)] = d
+            except OSError as e:
+                print(f"WARN: не смог следить за {d}: {e}", flush=True)
+
+    D_ORIG.mkdir(parents=True, exist_ok=True)
+    add_tree(D_ORIG)
+    idx = read_index()  # перечитывается перед каждой пачкой: файл меняют и другие режимы
+
+    # догоняем то, что появилось, пока демон не работал
+    process_batch(list(iter_photos()), idx)
+    print(f"[watch] слежу за {D_ORIG} (каталогов: {len(wds)}), debounce={WATCH_DEBOUNCE}s", flush=True)
+
+    pending = set(); first = last = 0.0
+    try:
+        while True:
+            timeout = None if not pending else max(0.0, min(last + WATCH_DEBOUNCE, first + WATCH_MAX_DELAY) - time.monotonic())
+            events = inotify.read(timeout=None if timeout is None else int(timeout*1000))
+            now = time.monotonic()
+            for ev in events:
+                if ev.mask & flags.Q_OVERFLOW:
+                    # очередь переполнена — события потеряны, пересматриваем всё (неизменённые пропустятся по sha1)
+                    pending.update(iter_photos())
+                    continue
+                base = wds.get(ev.wd)
+                if base is None or not ev.name:
+                    continue
+                p = base/ev.name
+                if ev.mask & flags.ISDIR:
+                    if ev.mask & (flags.CREATE | flags.MOVED_TO):
+                        add_tree(p)
+                        pending.update(x for x in p.glob("**/*") if x.is_file())
+                    continue
+                if ev.mask & file_mask and p.suffix.lower() in PHOTO_EXT:
+                    pending.add(p)
+            if events and pending:
+                if not first: first = now
+                last = now
+            if pending and (now - last >= WATCH_DEBOUNCE or now - first >= WATCH_MAX_DELAY):
+                batch, pending = pending, set()
+                first = last = 0.0
+                reload_index(idx)
+                process_batch(batch, idx)
+    except KeyboardInterrupt:
+        save_index(idx)
+        print("\n[watch] остановлен", flush=True)
+
+def recompress():
+    """
+    Фоновый проход: всё, что принято в fast-профиле, перекодируется из оригинала в compact.
+    Работает с nice 19; объект store заменяется атомарно, ссылки всех артикулов с тем же sha1
+    перевешиваются на новый файл. Индекс сохраняется каждые SAVE_EVERY объектов.
+    """
+    try: os.nice(19)
+    except OSError: pass
+    idx = read_index()
+    groups = {}  # sha1 → артикулы в fast-профиле
+    for art, rec in idx.items():
+        if isinstance(rec, dict) and rec.get("sha1") and rec.get("profile", "compact") != "compact":
+            groups.setdefault(rec["sha1"], []).append(art)
+    if not groups:
+        print("Нечего перекодировать: всё уже в compact", flush=True); return
+
+    done = 0; before = after = 0
+    try:
+        for sha1, arts in groups.items():
+            arts = [a for a in arts if a in idx]  # idx освежается при каждом save_index — артикул могли удалить
+            src = next((Path(idx[a]["original"]) for a in arts if Path(idx[a].get("original","")).is_file()), None)
+            if src is None: continue
+            raw = src.read_bytes()
+            if sha1_bytes(raw) != sha1: continue  # оригинал поменялся — его подхватит обычный проход
+            vect_obj, thumb_obj = store_path("vectorized", sha1), store_path("thumbs", sha1)
+            before += sum(o.stat().st_size for o in (vect_obj, thumb_obj) if o.exists())
+            im_res, im_th = derive(raw)
+            encode_webp(im_res, vect_obj, "compact")
+            encode_webp(im_th, thumb_obj, "compact")
+            after += vect_obj.stat().st_size + thumb_obj.stat().st_size
+            for a in arts:
+                link_into(vect_obj, Path(idx[a]["vectorized"]))
+                link_into(thumb_obj, Path(idx[a]["thumb"]))
+                idx[a]["profile"] = "compact"
+            done += 1
+            if done % SAVE_EVERY == 0:
+                save_index(idx)
+                print(f"[{done}/{len(groups)}] перекодировано", flush=True)
+    except KeyboardInterrupt:
+        print("\nINTERRUPTED", flush=True)
+    save_index(idx)
+    print(f"OK: перекодировано в compact: {done} из {len(groups)}; "
+          f"было {before/1024:.0f} КБ, стало {after/1024:.0f} КБ", flush=True)
+    print_enc_stats()
+
+def dedup():
+    """
+    Разовая миграция и уборка хранилища:
+    • производные, записанные до появления store/, переносятся туда (по sha1 из индекса)
+      и заменяются ссылками — дубликаты одного фото схлопываются в один файл;
+    • объекты store/, на которые не ссылается ни одна запись photos_index.json, удаляются.
+      Число жёстких ссылок тут не показатель: при копии вместо ссылки (link_into) объект
+      в работе, а st_nlink == 1. Свежие объекты (моложе STORE_GC_GRACE) не трогаем — их
+      мог только что записать --watch, ещё не сохранивший индекс.
+    """
+    idx = read_index()
+    adopted = removed = 0
+    for art, rec in idx.items():
+        sha1 = rec.get("sha1") if isinstance(rec, dict) else None
+        if not sha1: continue
+        for kind, key, ext in (("vectorized", "vectorized", ".webp"), ("thumbs", "thumb", ".webp"),
+                               ("tg", "tg", ".jpg"), ("xlsx", "xlsx", ".png")):
+            dst = Path(rec.get(key, ""))
+            if not dst.is_file(): continue
+            obj = store_path(kind, sha1, ext)
+            if obj.exists():
+                if os.path.samefile(obj, dst): continue
+            else:
+                obj.parent.mkdir(parents=True, exist_ok=True)
+                try: os.link(dst, obj)
+                except OSError: shutil.copy2(dst, obj)
+            link_into(obj, dst); adopted += 1
+    kinds = (("vectorized", ".webp"), ("thumbs", ".webp"), ("tg", ".jpg"), ("xlsx", ".png"))
+    used = {store_path(kind, r["sha1"], ext) for r in read_index().values()  # свежая версия: её могли поменять
+            if isinstance(r, dict) and r.get("sha1") for kind, ext in kinds}
+    now = time.time()
+    for obj in D_STORE.glob("*/*/[0-9a-f]*.*"):
+        if obj not in used and now - obj.stat().st_mtime > STORE_GC_GRACE:
+            obj.unlink(); removed += 1
+    print(f"OK: перенесено в store: {adopted}, удалено объектов без ссылок: {removed}", flush=True)
+
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--watch", action="store_true", help="Следить за original/ (inotify) и обрабатывать новые фото сразу")
+    ap.add_argument("--recompress", action="store_true", help="Фоном перекодировать fast-профиль в compact")
+    ap.add_argument("--changes", type=Path, help="JSON с набором изменений от sync_photos_guarded.py")
+    ap.add_argument("--dedup", action="store_true", help="Перенести старые производные в store/ и убрать объекты без ссылок")
+    args = ap.parse_args()
+    if args.dedup: dedup()
+    elif args.recompress: recompress()
+    elif args.changes: apply_changes(args.changes)
+    elif args.watch: watch()
+    else: main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+png_cache.py — ограниченный дисковый кэш производных PNG (LRU по времени доступа).
+
+Назначение:
+  • Общий кэш для search_photo.ensure_png_for_excel и AI/demos/send_pick_demo.py
+    (раньше _png росли бесконечно и никогда не чистились).
+  • Лимит по размеру (PNG_CACHE_MAX_MB, по умолчанию 512 МБ): при превышении удаляются
+    файлы с самым старым atime, пока кэш не ужмётся до 90% лимита.
+  • atime выставляется явно при каждом попадании — не зависит от noatime/relatime у раздела.
+  • Запись атомарная: рендер во временный файл рядом и os.replace.
+  • Статистика hits/misses/evictions копится в <кэш>/_stats.json (сбрасывается при выходе процесса).
+
+Пример:
+  cache = PngCache(Path("/srv/luckypack/data/PhotoPicks/_png"))
+  p = cache.get_or_render("4610027750756.png", lambda dst: im.save(dst, "PNG"), src=thumb)
+"""
+from __future__ import annotations
+import atexit, json, os, time
+from pathlib import Path
+from typing import Callable, Optional
+
+PNG_CACHE_DIR = Path(os.getenv("PNG_CACHE_DIR", "/srv/luckypack/data/PhotoPicks/_png"))
+PNG_CACHE_MAX_MB = int(os.getenv("PNG_CACHE_MAX_MB", "512"))
+LOW_WATERMARK = 0.9  # после вытеснения кэш занимает не больше 90% лимита
+STATS_FILE = "_stats.json"
+
+
+class PngCache:
+    def __init__(self, root: Path = PNG_CACHE_DIR, max_bytes: int = PNG_CACHE_MAX_MB * 1024 * 1024):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "evicted_bytes": 0}
+        self._size: Optional[int] = None  # текущий размер; считается лениво при первой записи
+        atexit.register(self.flush_stats)
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key
+
+    def get(self, key: str, src: Optional[Path] = None) -> Optional[Path]:
+        """Путь к закэшированному файлу или None. Если src новее кэша — считаем промахом."""
+        p = self.path_for(key)
+        try:
+            st = p.stat()
+            if src is not None and Path(src).stat().st_mtime > st.st_mtime:
+                self.stats["misses"] += 1
+                return None
+            os.utime(p, (time.time(), st.st_mtime))  # отметка доступа для LRU
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return p
+
+    def put(self, key: str, render: Callable[[Path], None]) -> Path:
+        """render(tmp_path) пишет файл; кладём его в кэш атомарно и при необходимости вытесняем старое."""
+        p = self.path_for(key)
+        tmp = p.with_name(f".{p.name}.{os.getpid()}.tmp")
+        try:
+            render(tmp)
+            old = p.stat().st_size if p.exists() else 0
+            tmp.replace(p)
+        finally:
+            tmp.unlink(missing_ok=True)
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += p.stat().st_size - old
+        if self._size > self.max_bytes:
+            self.evict()
+        return p
+
+    def get_or_render(self, key: str, render: Callable[[Path], None], src: Optional[Path] = None) -> Optional[Path]:
+        p = self.get(key, src=src)
+        if p is not None:
+            return p
+        try:
+            return self.put(key, render)
+        except Exception:
+            return None
+
+    def _entries(self):
+        for p in self.root.glob("*.png"):
+            try:
+                yield p, p.stat()
+            except FileNotFoundError:
+                continue  # удалил соседний процесс
+
+    def _scan_size(self) -> int:
+        return sum(st.st_size for _, st in self._entries())
+
+    def evict(self) -> int:
+        """Удаляет самые давно использованные файлы, пока размер не станет ≤ LOW_WATERMARK·лимита."""
+        entries = sorted(self._entries(), key=lambda e: e[1].st_atime)
+        total = sum(st.st_size for _, st in entries)
+        target = int(self.max_bytes * LOW_WATERMARK)
+        removed = 0
+        for p, st in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            total -= st.st_size
+            removed += 1
+            self.stats["evicted_bytes"] += st.st_size
+        self.stats["evictions"] += removed
+        self._size = total
+        return removed
+
+    def flush_stats(self):
+        """Добавляет счётчики процесса к накопленным в _stats.json (атомарно) и обнуляет их."""
+        if not any(self.stats.values()):
+            return
+        path = self.root / STATS_FILE
+        try:
+            acc = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            acc = {}
+        for k, v in self.stats.items():
+            acc[k] = int(acc.get(k, 0)) + v
+        acc["size_bytes"] = self._size if self._size is not None else self._scan_size()
+        acc["max_bytes"] = self.max_bytes
+        acc["updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        tmp = path.with_name(f".{STATS_FILE}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps(acc, ensure_ascii=False, indent=2), encoding="utf-8")
+            tmp.replace(path)
+        except Exception:
+            tmp.unlink(missing_ok=True)
+        self.stats = dict.fromkeys(self.stats, 0)
+
+
+if __name__ == "__main__":
+    # ручная проверка: печатает накопленную статистику и текущий размер
+    c = PngCache()
+    try:
+        print((c.root / STATS_FILE).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        print("{}")
+    print(f"size: {c._scan_size()/1024/1024:.1f} МБ из {c.max_bytes/1024/1024:.0f} МБ")
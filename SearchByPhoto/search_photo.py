@@ -9,13 +9,18 @@ from PIL import Image
 from openpyxl import Workbook
 from openpyxl.drawing.image import Image as XLImage
 from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from png_cache import PngCache
 
 PROJ = Path("/srv/luckypack/project")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "LuckyPricer"))
+import catalog  # скомпилированный products.sqlite
+from catalog import Product
 DATA = Path("/app/data/photos")
 EMB  = Path("/srv/luckypack/project/SearchByPhoto/index")
 PROD_JSON = PROJ / "LuckyPricer/products.json"
 PROD_JSONS_DIR = PROJ / "LuckyPricer/data/jsons"
-PNG_CACHE = Path("/srv/luckypack/data/PhotoPicks/_png"); PNG_CACHE.mkdir(parents=True, exist_ok=True)
+PROD_DB = PROJ / "LuckyPricer/products.sqlite"
+PNG_CACHE = PngCache()  # /srv/luckypack/data/PhotoPicks/_png, LRU с лимитом PNG_CACHE_MAX_MB
 
 # Попытка подключить FAISS (для оффлайн-поиска по уже индексированному артикулу)
 try:
@@ -39,7 +44,7 @@ def now_msk_str()->str:
     dt = datetime.datetime.utcnow() + datetime.timedelta(hours=3)
     return dt.strftime("%d.%m.%Y %H:%M МСК")
 
-def _load_products_from_products_json(path: Path)->Dict[str,Dict[str,str]]:
+def _load_products_from_products_json(path: Path)->Dict[str,Product]:
     if not path.exists(): return {}
     try:
         arr = json.loads(path.read_text(encoding="utf-8"))
@@ -50,17 +55,10 @@ def _load_products_from_products_json(path: Path)->Dict[str,Dict[str,str]]:
     for rec in arr:
         art = str(rec.get("Артикул","")).strip()
         if not art: continue
-        name = rec.get("Наименование") or rec.get("Номенклатура, Характеристика, Упаковка") or rec.get("Номенклатура") or ""
-        out[art] = {
-            "Наименование": str(name),
-            "ШТ/КОР": str(rec.get("ШТ/КОР","")),
-            "ОПТ с НДС": str(rec.get("ОПТ с НДС","")),
-            "ОПТ с НДС от 150 000 руб.": str(rec.get("ОПТ с НДС от 150 000 руб.","")),
-            "СПЕЦ ЦЕНА": str(rec.get("СПЕЦ ЦЕНА","")),
-        }
+        out[art] = Product(rec)
     return out
 
-def _load_products_from_jsons_dir(dir_path: Path)->Dict[str,Dict[str,str]]:
+def _load_products_from_jsons_dir(dir_path: Path)->Dict[str,Product]:
     out = {}
     if not dir_path.exists(): return out
     for p in sorted(dir_path.glob("*.json")):
@@ -72,39 +70,24 @@ def _load_products_from_jsons_dir(dir_path: Path)->Dict[str,Dict[str,str]]:
         for rec in arr:
             art = str(rec.get("Артикул","")).strip()
             if not art: continue
-            name = rec.get("Наименование") or rec.get("Номенклатура, Характеристика, Упаковка") or rec.get("Номенклатура") or ""
-            out[art] = {
-                "Наименование": str(name),
-                "ШТ/КОР": str(rec.get("ШТ/КОР","")),
-                "ОПТ с НДС": str(rec.get("ОПТ с НДС","")),
-                "ОПТ с НДС от 150 000 руб.": str(rec.get("ОПТ с НДС от 150 000 руб.","")),
-                "СПЕЦ ЦЕНА": str(rec.get("СПЕЦ ЦЕНА","")),
-            }
+            out[art] = Product(rec)
     return out
 
-def load_products()->Dict[str,Dict[str,str]]:
+def load_products(arts: Optional[List[str]] = None)->Dict[str,Product]:
+    # есть свежий каталог — берём из него только нужные артикулы, products.json целиком не разбираем
+    if arts is not None and catalog.available(PROD_DB, PROD_JSON):
+        return {a: Product(rec) for a, rec in catalog.get_many(arts, PROD_DB, PROD_JSON).items()}
     prod = _load_products_from_products_json(PROD_JSON)
     return prod if prod else _load_products_from_jsons_dir(PROD_JSONS_DIR)
 
 def ensure_png_for_excel(article: str)->Optional[Path]:
-    p_png = PNG_CACHE / f"{article}.png"
-    if p_png.exists(): return p_png
+    p_ready = DATA / "xlsx" / f"{article}.png"  # готовый рендишен из image_opt.py
+    if p_ready.exists(): return p_ready
     p_thumb = DATA / "thumbs" / f"{article}.webp"
     p_vect  = DATA / "vectorized" / f"{article}.webp"
     src = p_thumb if p_thumb.exists() else (p_vect if p_vect.exists() else None)
-    if src is None: return None
-    try:
-        Image.open(src).convert("RGBA").save(p_png)
-        return p_png
-    except Exception:
-        return None
-
-def _num(v: str):
-    if not v: return None
-    try:
-        return float(v.replace(" ","").replace("\\u00A0","").replace(",","."))
-    except Exception:
-        return None
+    if src is None: return PNG_CACHE.get(f"{article}.png")
+    return PNG_CACHE.get_or_render(f"{article}.png", lambda dst: Image.open(src).convert("RGBA").save(dst, "PNG"), src=src)
 
 def _style_title(ws, title: str):
     ws.merge_cells("A1:H1")
@@ -138,7 +121,7 @@ def _auto_fit(ws, start_row: int, end_row: int):
         if letter == "H": width = max(width, 12)
         ws.column_dimensions[letter].width = float(width)
 
-def build_excel(arts: List[str], products: Dict[str,Dict[str,str]], title: str, out_path: Path)->Path:
+def build_excel(arts: List[str], products: Dict[str,Product], title: str, out_path: Path)->Path:
     wb = Workbook(); ws = wb.active
     _style_title(ws, title)
     _style_contacts(ws)
@@ -151,7 +134,7 @@ def build_excel(arts: List[str], products: Dict[str,Dict[str,str]], title: str,
         r += 1
     else:
         for art in arts:
-            rec = products.get(art, {})
+            rec = products.get(art) or Product({"Артикул": art})
             p_png = ensure_png_for_excel(art)
             if p_png and p_png.exists():
                 img = XLImage(str(p_png))
@@ -162,20 +145,15 @@ def build_excel(arts: List[str], products: Dict[str,Dict[str,str]], title: str,
                 ws.row_dimensions[r].height = 75
                 img.anchor = f"A{r}"; ws.add_image(img)
             ws.cell(row=r, column=2, value=art).alignment = ALIGN_LEFT_TOP
-            ws.cell(row=r, column=3, value=rec.get("Наименование","")).alignment = ALIGN_LEFT_TOP
-            ws.cell(row=r, column=4, value=rec.get("ШТ/КОР","")).alignment = ALIGN_RIGHT
-
-            v5=_num(rec.get("ОПТ с НДС","")); c5=ws.cell(row=r, column=5, value=v5 if v5 is not None else rec.get("ОПТ с НДС",""))
-            if v5 is not None: c5.number_format="#,##0.00"; c5.alignment=ALIGN_RIGHT
-            else: c5.alignment=ALIGN_RIGHT
+            ws.cell(row=r, column=3, value=rec.name).alignment = ALIGN_LEFT_TOP
+            ws.cell(row=r, column=4, value=rec.per_box if rec.per_box is not None else rec.per_box_text).alignment = ALIGN_RIGHT
 
-            v6=_num(rec.get("ОПТ с НДС от 150 000 руб.","")); c6=ws.cell(row=r, column=6, value=v6 if v6 is not None else rec.get("ОПТ с НДС от 150 000 руб.",""))
-            if v6 is not None: c6.number_format="#,##0.00"; c6.alignment=ALIGN_RIGHT
-            else: c6.alignment=ALIGN_RIGHT
-
-            v7=_num(rec.get("СПЕЦ ЦЕНА","")); c7=ws.cell(row=r, column=7, value=v7 if v7 is not None else rec.get("СПЕЦ ЦЕНА",""))
-            if v7 is not None: c7.number_format="#,##0.00"; c7.alignment=ALIGN_RIGHT
-            else: c7.alignment=ALIGN_RIGHT
+            for col, kop, text in ((5, rec.price, rec.price_text), (6, rec.price_150k, rec.price_150k_text),
+                                   (7, rec.price_special, rec.price_special_text)):
+                v = kop / 100 if kop is not None else None  # цены в каталоге — копейки; не число — исходный текст
+                c = ws.cell(row=r, column=col, value=v if v is not None else text)
+                if v is not None: c.number_format="#,##0.00"
+                c.alignment = ALIGN_RIGHT
 
             ws.cell(row=r, column=8, value="").alignment = ALIGN_RIGHT
             r += 1
@@ -197,19 +175,24 @@ def build_excel(arts: List[str], products: Dict[str,Dict[str,str]], title: str,
     wb.save(str(out_path))
     return out_path
 
-def _load_img_ids()->List[str]:
-    p = EMB / "img_ids.npy"
+def _index_dir()->Path:
+    """Текущее поколение индекса (build_image_index публикует его симлинком img_current) — резолвим один раз."""
+    cur = EMB / "img_current"
+    return cur.resolve() if cur.exists() else EMB
+
+def _load_img_ids(d: Optional[Path] = None)->List[str]:
+    p = (d or _index_dir()) / "img_ids.npy"
     if not p.exists(): raise FileNotFoundError(f"Нет файла: {p}")
     arr = np.load(str(p), allow_pickle=True)
     out = []
     for x in arr: out.append(x.decode("utf-8","ignore") if isinstance(x,(bytes,bytearray)) else str(x))
     return out
 
-def _load_faiss_index():
+def _load_faiss_index(d: Optional[Path] = None):
     if faiss is None:
         print("ERROR: FAISS не установлен в этом окружении.", file=sys.stderr)
         return None
-    idx_path = EMB / "faiss_img.index"
+    idx_path = (d or _index_dir()) / "faiss_img.index"
     if not idx_path.exists():
         print(f"ERROR: Не найден индекс: {idx_path}", file=sys.stderr)
         return None
@@ -224,13 +207,14 @@ def _neighbors_by_article(article: str, topk: int = 5, include_self: bool = Fals
     Возвращает список соседей (артикулы) по уже индексированному артикулу.
     Никаких сетевых вызовов. Требует support reconstruct() у индекса.
     """
-    ids = _load_img_ids()
+    d = _index_dir()  # ids и faiss — из одного поколения
+    ids = _load_img_ids(d)
     base = Path(article.strip()).stem  # снимаем расширение, если передали имя файла
     lookup = {s: i for i, s in enumerate(ids)}
     if base not in lookup:
         raise KeyError(f"Артикул '{article}' не найден в индексе.")
     row = lookup[base]
-    index = _load_faiss_index()
+    index = _load_faiss_index(d)
     if index is None:
         raise RuntimeError("FAISS недоступен.")
     try:
@@ -263,7 +247,6 @@ def main():
     ap.add_argument("--excel", required=True); ap.add_argument("--title", default="")
     args = ap.parse_args()
     title = args.title.strip() or f"Подбор по фото — {now_msk_str()}"
-    products = load_products()
 
     if args.by_article:
         try:
@@ -275,6 +258,7 @@ def main():
         ids = _load_img_ids()
         arts = ids[:args.n] if args.smoke else []
 
+    products = load_products(arts)
     out = build_excel(arts, products, title, Path(args.excel))
 
     if args.as_json:
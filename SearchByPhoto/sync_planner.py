@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sync_planner.py — план ночной пересборки image-индекса в одном процессе.
+
+ЗАДАЧА
+- Посчитать VALID = (CANDIDATES ∩ PRODUCTS) \\ INDEXED, где:
+    CANDIDATES — артикулы по именам *.webp в /app/data/photos/vectorized,
+    PRODUCTS   — «Артикул» из products.json,
+    INDEXED    — id из img_ids.npy.
+- Каждый источник читается один раз и превращается в множество ключей:
+  цифровой артикул без ведущего нуля — int (EAN-13 и т.п.), остальное — строка как есть,
+  чтобы "04600..." не превратился в другой артикул.
+- Раньше это делали три процесса tools/list_*.py; теперь они — тонкие обёртки над этим модулем.
+
+ЗАПУСК
+  python3 sync_planner.py          # счётчики и пример
+  python3 sync_planner.py --list   # VALID по одному в строке (для shell)
+
+ИМПОРТ
+  from sync_planner import plan
+  p = plan(); p["valid"]  # множество ключей; str(k) — артикул
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "LuckyPricer"))
+import catalog  # noqa: E402
+
+VECT = "/app/data/photos/vectorized"
+PROD = "/srv/luckypack/project/LuckyPricer/products.json"
+IDS = "/srv/luckypack/project/SearchByPhoto/index/img_ids.npy"
+
+
+def ean_key(s):
+    """Ключ множества: int для цифровых артикулов без ведущего нуля, иначе строка."""
+    s = s.strip()
+    if s.isdigit() and s[0] != "0" and s.isascii():
+        return int(s)
+    return s
+
+
+def is_article_name(name: str) -> bool:
+    """Правило валидации артикула по имени файла (без .webp): без пробелов/скобок, только [0-9A-Za-z-_]."""
+    if not name:
+        return False
+    if "(" in name or ")" in name or " " in name:
+        return False
+    for ch in name:
+        if not (ch.isalnum() or ch in "-_"):
+            return False
+    return True
+
+
+def load_candidates(vect=VECT):
+    """Артикулы с готовым .webp; None, если папки нет."""
+    if not os.path.isdir(vect):
+        return None
+    out = set()
+    with os.scandir(vect) as it:
+        for e in it:
+            if e.name.endswith(".webp") and is_article_name(e.name[:-5]):
+                out.add(ean_key(e.name[:-5]))
+    return out
+
+
+def load_products(path=PROD):
+    """Артикулы из каталога (products.sqlite рядом с path, если свежий, иначе сам products.json)."""
+    return {ean_key(a) for a in catalog.articles(os.path.splitext(path)[0] + ".sqlite", path)}
+
+
+def load_indexed(path=IDS):
+    """Id из img_ids.npy; пустое множество, если индекса нет или он битый."""
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return set()
+    import numpy as np
+    try:
+        arr = np.load(path, allow_pickle=True)
+    except Exception:
+        return set()
+    out = set()
+    for it in arr:
+        s = it.decode("utf-8", "ignore") if isinstance(it, (bytes, bytearray)) else str(it)
+        if s.strip():
+            out.add(ean_key(s))
+    return out
+
+
+def plan(vect=VECT, prod=PROD, ids=IDS):
+    """Словарь множеств candidates/products/indexed/valid; candidates=None — нет папки vectorized."""
+    candidates = load_candidates(vect)
+    products = load_products(prod)
+    indexed = load_indexed(ids)
+    valid = ((candidates or set()) & products) - indexed
+    return {"candidates": candidates, "products": products, "indexed": indexed, "valid": valid}
+
+
+def sorted_keys(keys):
+    return sorted(keys, key=str)
+
+
+def main() -> int:
+    p = plan()
+    if p["candidates"] is None:
+        print(f"Нет папки {VECT}", file=sys.stderr)
+        return 1
+    if "--list" in sys.argv:
+        for k in sorted_keys(p["valid"]):
+            print(k)
+        return 0
+    print(f"candidates : {len(p['candidates'])}")
+    print(f"products   : {len(p['products'])}")
+    print(f"indexed    : {len(p['indexed'])}")
+    print(f"valid      : {len(p['valid'])}  = (candidates ∩ products) \\ indexed")
+    print("sample     :", [str(k) for k in sorted_keys(p["valid"])[:30]])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,6 +16,8 @@ list_candidates.py — даёт список «кандидатов к инде
 - RC=0 при успехе; RC=1, если папка vectorized отсутствует.
 
 КОНТЕКСТ
+- Обёртка над sync_planner.load_candidates (там же правило is_article_name);
+  весь план одним процессом: sync_planner.py.
 - Используется в nightly_photo_rebuild.sh в формуле:
     VALID = (CANDIDATES ∩ PRODUCTS) \ INDEXED
   где:
@@ -27,32 +29,15 @@ list_candidates.py — даёт список «кандидатов к инде
 import os
 import sys
 
-VECT = "/app/data/photos/vectorized"
-
-
-def is_article_name(name: str) -> bool:
-    """Правило валидации артикула по имени файла (без .webp)."""
-    if not name:
-        return False
-    if "(" in name or ")" in name or " " in name:
-        return False
-    for ch in name:
-        if not (ch.isalnum() or ch in "-_"):
-            return False
-    return True
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sync_planner import VECT, load_candidates, sorted_keys  # правило валидации (is_article_name) — в sync_planner
 
 
 def main() -> int:
-    if not os.path.isdir(VECT):
+    cands = load_candidates(VECT)
+    if cands is None:
         return 1
-    out = []
-    for fname in os.listdir(VECT):
-        if not fname.endswith(".webp"):
-            continue
-        base = fname[:-5]
-        if is_article_name(base):
-            out.append(base)
-    for a in out:
+    for a in sorted_keys(cands):
         print(a)
     return 0
 
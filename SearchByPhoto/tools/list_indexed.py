@@ -15,6 +15,7 @@ list_indexed.py — печатает уже ПРОИНДЕКСИРОВАННЫЕ
   • если всё ок — печатает id
 
 КОНТЕКСТ
+- Обёртка над sync_planner.load_indexed; весь план одним процессом: sync_planner.py.
 - Используется в nightly_photo_rebuild.sh:
     VALID = (CANDIDATES ∩ PRODUCTS) \ INDEXED
   где:
@@ -23,32 +24,14 @@ list_indexed.py — печатает уже ПРОИНДЕКСИРОВАННЫЕ
 
 import os
 import sys
-import numpy as np
 
-IDS = "/srv/luckypack/project/SearchByPhoto/index/img_ids.npy"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sync_planner import IDS, load_indexed, sorted_keys
 
 
 def main() -> int:
-    if not os.path.isfile(IDS) or os.path.getsize(IDS) == 0:
-        return 0
-    try:
-        arr = np.load(IDS, allow_pickle=True).tolist()
-    except Exception:
-        # файл битый — не шумим (по ТЗ), просто «как будто индекса нет»
-        return 0
-
-    seen = set()
-    out = []
-    for it in arr:
-        if isinstance(it, (bytes, bytearray)):
-            s = it.decode("utf-8", "ignore").strip()
-        else:
-            s = str(it).strip()
-        if s and s not in seen:
-            seen.add(s)
-            out.append(s)
-    out.sort()
-    for s in out:
+    # файл отсутствует/пустой/битый — пустой вывод и RC=0 (как «индекса нет»)
+    for s in sorted_keys(load_indexed(IDS)):
         print(s)
     return 0
 
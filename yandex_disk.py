@@ -0,0 +1,384 @@
+"""
+yandex_disk.py — общие помощники для скачивания с Яндекс.Диска
+
+Назначение:
+    • fetch_to_file() — докачиваемая загрузка по href во временный <файл>.part:
+      при обрыве сети .part остаётся, следующий запуск продолжает его с места обрыва (HTTP Range).
+    • Перед атомарным rename файл сверяется с size и md5 из листинга Я.Диска;
+      при несовпадении .part удаляется и поднимается ChecksumError.
+    • YandexClient — общий клиент API: пул соединений, token bucket на запросы к cloud-api
+      (YADISK_RPS в секунду, всплеск до YADISK_BURST), повторы с экспоненциальной паузой на 429/5xx
+      и сетевых ошибках с учётом Retry-After. На 429 темп запросов процесса снижается вдвое и
+      плавно восстанавливается на успешных ответах. Лимитер и счётчики общие на процесс (STATS).
+    • list_tree() — полный листинг публичной папки: обход в ширину, папки и страницы параллельно,
+      только нужные поля. С cache_path листинги папок кэшируются вместе с их modified: папка,
+      чей modified в листинге родителя не изменился, берётся из кэша целиком с поддеревом.
+      Раз в YADISK_LIST_CACHE_MAX_AGE_H часов (по умолчанию 24) листинг делается полностью —
+      на случай, если Диск не поднял modified папки при изменении глубоко внутри. Возраст сравнивается
+      с порогом с допуском YADISK_LIST_CACHE_SLACK_H (по умолчанию 1 ч): у ночного синка возраст кэша
+      от прошлой ночи гуляет вокруг 24 ч, и без допуска кэш выбрасывался почти каждую ночь.
+    • Используется LuckyDownloader/photo_sync/yandex_api.py (оригиналы фото), LuckyDownloader/pull_missing_to_vectorized.py
+      и LuckyPricer/price_cache.py (прайсы).
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_TIMEOUT = (10, 60)  # (connect, read) на каждый запрос
+FILE_TIMEOUT = int(os.getenv("YADISK_FILE_TIMEOUT", "300"))  # предел на один файл целиком, сек
+CHUNK = 256 * 1024
+
+API_BASE = os.getenv("YADISK_API_BASE", "https://cloud-api.yandex.net/v1/disk").rstrip("/")
+RPS = float(os.getenv("YADISK_RPS", "10"))          # устойчивый темп запросов к API
+BURST = int(os.getenv("YADISK_BURST", "20"))         # допустимый всплеск
+MAX_RETRIES = int(os.getenv("YADISK_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("YADISK_BACKOFF_BASE", "0.5"))  # сек, удваивается с каждой попыткой
+BACKOFF_MAX = 60.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+LIST_WORKERS = int(os.getenv("YADISK_LIST_WORKERS", "8"))
+LIST_LIMIT = int(os.getenv("YADISK_LIST_LIMIT", "1000"))  # элементов на страницу
+ITEM_FIELDS = ("name", "path", "type", "modified", "md5", "size")
+LIST_FIELDS = ",".join([f"_embedded.items.{k}" for k in ITEM_FIELDS] + ["_embedded.total"])
+LIST_CACHE_MAX_AGE = float(os.getenv("YADISK_LIST_CACHE_MAX_AGE_H", "24")) * 3600  # 0 — кэш листинга выключен
+LIST_CACHE_SLACK = float(os.getenv("YADISK_LIST_CACHE_SLACK_H", "1")) * 3600  # допуск на дрейф времени запуска
+
+
+class ChecksumError(Exception):
+    """Скачанный файл не совпал с size/md5 из листинга."""
+
+
+def _md5_of(path):
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fetch_to_file(session, href, dst, md5=None, size=None, timeout=HTTP_TIMEOUT, file_timeout=FILE_TIMEOUT):
+    """
+    Скачивает href в dst через dst.part с докачкой и проверкой. Возвращает число байт, полученных в этом вызове.
+    Сетевые ошибки и таймауты пробрасываются, .part при этом сохраняется для докачки.
+    """
+    part = dst + ".part"
+    have = os.path.getsize(part) if os.path.exists(part) else 0
+    if size is not None and have > size:
+        os.remove(part); have = 0  # файл на Диске стал меньше — .part от другой версии
+
+    received = 0
+    if not (size is not None and have == size):  # иначе .part уже полный — только проверка
+        headers = {"Range": f"bytes={have}-"} if have else {}
+        deadline = time.monotonic() + file_timeout
+        with session.get(href, stream=True, timeout=timeout, headers=headers) as r:
+            if r.status_code == 416:  # сервер не принял Range — начинаем заново в следующий раз
+                os.remove(part)
+                raise ChecksumError(f"Range {have}- не принят сервером, .part сброшен")
+            r.raise_for_status()
+            mode = "ab" if (have and r.status_code == 206) else "wb"
+            os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+            with open(part, mode) as out:
+                for chunk in r.iter_content(chunk_size=CHUNK):
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"file timeout {file_timeout}s")
+                    if chunk:
+                        out.write(chunk); received += len(chunk)
+
+    got = os.path.getsize(part)
+    if size is not None and got != size:
+        if got > size:
+            os.remove(part)
+            raise ChecksumError(f"size {got} != {size}")
+        raise ConnectionError(f"incomplete: {got} of {size} bytes, .part сохранён")
+    if md5 and _md5_of(part) != md5.lower():
+        os.remove(part)
+        raise ChecksumError("md5 mismatch")
+    os.replace(part, dst)
+    return received
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket с адаптивным темпом: slow_down() на 429, speed_up() на успехах."""
+
+    def __init__(self, rate=RPS, burst=BURST):
+        self.max_rate = self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.stamp = time.monotonic()
+        self.last_cut = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Ждёт токен; возвращает время ожидания в секундах."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                pause = (1 - self.tokens) / self.rate
+            time.sleep(pause); waited += pause
+
+    def slow_down(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_cut < 1.0:
+                return  # пачка 429 от параллельных потоков — одно снижение, а не несколько
+            self.last_cut = now
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def speed_up(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+LIMITER = TokenBucket()
+STATS = {"requests": 0, "retries": 0, "throttled": 0, "server_errors": 0, "network_errors": 0, "failed": 0, "wait_s": 0.0}
+_STATS_LOCK = threading.Lock()
+
+
+def _count(key, n=1):
+    with _STATS_LOCK:
+        STATS[key] += n
+
+
+def stats_line():
+    """Краткая сводка счётчиков для логов."""
+    s = dict(STATS)
+    return (f"API: запросов {s['requests']}, повторов {s['retries']}, 429 {s['throttled']}, 5xx {s['server_errors']}, "
+            f"сеть {s['network_errors']}, отказов {s['failed']}, ожидание лимитера {s['wait_s']:.1f} с, "
+            f"темп {LIMITER.rate:.1f}/{LIMITER.max_rate:.0f} rps")
+
+
+def _retry_after(resp):
+    """Retry-After в секундах (число или HTTP-дата) либо None."""
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class YandexClient:
+    """
+    Обёртка над requests.Session с лимитером и повторами. Совместима с session.get(...),
+    поэтому её можно передавать в fetch_to_file. Лимитер применяется только к хосту API_BASE
+    (ссылки на скачивание ведут на downloader.disk.yandex.ru), повторы — ко всем запросам.
+    """
+
+    def __init__(self, pool_size=8, limiter=LIMITER, max_retries=MAX_RETRIES):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.api_host = urlparse(API_BASE).netloc
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", HTTP_TIMEOUT)
+        limited = urlparse(url).netloc == self.api_host
+        for attempt in range(self.max_retries + 1):
+            if limited:
+                waited = self.limiter.acquire()
+                if waited:
+                    _count("wait_s", waited)
+            _count("requests")
+            resp = None
+            try:
+                resp = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                _count("network_errors")
+                if attempt == self.max_retries:
+                    _count("failed"); raise
+            else:
+                if resp.status_code not in RETRY_STATUS:
+                    if limited:
+                        self.limiter.speed_up()
+                    return resp
+                if resp.status_code == 429:
+                    _count("throttled")
+                    if limited:
+                        self.limiter.slow_down()
+                else:
+                    _count("server_errors")
+                if attempt == self.max_retries:
+                    _count("failed"); return resp
+                resp.close()
+            pause = _retry_after(resp)
+            if pause is None:
+                pause = BACKOFF_BASE * (2 ** attempt) * (0.5 + random.random())  # jitter против синхронных повторов
+            _count("retries")
+            time.sleep(min(pause, BACKOFF_MAX))
+
+    def api(self, endpoint, params, **kwargs):
+        """GET {API_BASE}/{endpoint}; endpoint вида "public/resources"."""
+        return self.get(f"{API_BASE}/{endpoint.lstrip('/')}", params=params, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_changed(old, new):
+    """Изменился ли файл по сравнению с записью манифеста: md5, затем size, затем modified (что есть в обоих)."""
+    if not old:
+        return True
+    for key in ("md5", "size", "modified"):
+        if old.get(key) is not None and new.get(key) is not None:
+            return old[key] != new[key]
+    return True
+
+
+def _list_page(client, public_key, path, offset):
+    """Одна страница содержимого папки: (items, total | None)."""
+    params = {
+        "public_key": public_key,
+        "path": path,
+        "limit": LIST_LIMIT,
+        "offset": offset,
+        "fields": LIST_FIELDS,
+    }
+    response = client.api("public/resources", params, timeout=HTTP_TIMEOUT)
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.status_code} — {response.text[:300]}")
+    emb = response.json().get("_embedded") or {}
+    return emb.get("items") or [], emb.get("total")
+
+
+def _load_list_cache(cache_path, public_key, path):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except Exception:
+        return None
+    if cache.get("public_key") != public_key or cache.get("root") != path:
+        return None
+    if time.time() - float(cache.get("full", 0)) > LIST_CACHE_MAX_AGE + LIST_CACHE_SLACK:
+        return None  # пора сделать полный листинг
+    return cache
+
+
+def _save_list_cache(cache_path, cache):
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp = cache_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp, cache_path)
+
+
+def list_tree(public_key, path="/", cache_path=None, workers=LIST_WORKERS, log=None):
+    """
+    Полный список файлов под path. Возвращает (files, complete, failed_dirs): complete=False,
+    если какая-то страница не получена — тогда список неполный и удалять «лишнее» по нему нельзя.
+    Файлы — словари с ITEM_FIELDS без type, отсортированы по path.
+    """
+    old = _load_list_cache(cache_path, public_key, path) if (cache_path and LIST_CACHE_MAX_AGE > 0) else None
+    old_dirs = old["dirs"] if old else {}
+    dirs = {}            # path -> {"modified", "files", "dirs"} для нового кэша
+    broken = set()       # папки, у которых не получена хотя бы одна страница
+    files, failed = [], []
+    reused = requests_made = 0
+
+    def reuse(dir_path):
+        """Переносит поддерево из старого кэша; False, если в кэше его нет целиком."""
+        stack, taken = [dir_path], {}
+        while stack:
+            d = stack.pop()
+            entry = old_dirs.get(d)
+            if entry is None:
+                return False
+            taken[d] = entry
+            stack.extend(entry["dirs"])
+        for d, entry in taken.items():
+            dirs[d] = entry
+            files.extend(entry["files"])
+        return len(taken)
+
+    client = YandexClient(workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(dir_path, offset):
+            nonlocal requests_made
+            requests_made += 1
+            pending[pool.submit(_list_page, client, public_key, dir_path, offset)] = (dir_path, offset)
+
+        pending = {}
+        dirs[path] = {"modified": None, "files": [], "dirs": []}
+        submit(path, 0)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                dir_path, offset = pending.pop(fut)
+                try:
+                    items, total = fut.result()
+                except Exception as e:
+                    failed.append(dir_path); broken.add(dir_path)
+                    if log:
+                        log(f"Ошибка при получении списка файлов {dir_path} (offset {offset}): {e}")
+                    continue
+                entry = dirs[dir_path]
+                for item in items:
+                    if item.get("type") == "file":
+                        f = {k: item.get(k) for k in ITEM_FIELDS if k != "type"}
+                        entry["files"].append(f); files.append(f)
+                    elif item.get("type") == "dir":
+                        sub = item["path"]
+                        entry["dirs"].append(sub)
+                        cached = old_dirs.get(sub)
+                        if cached and cached.get("modified") and cached["modified"] == item.get("modified"):
+                            n = reuse(sub)
+                            if n:
+                                reused += n; continue
+                        dirs[sub] = {"modified": item.get("modified"), "files": [], "dirs": []}
+                        submit(sub, 0)
+                if offset == 0 and total is not None:
+                    for off in range(LIST_LIMIT, total, LIST_LIMIT):
+                        submit(dir_path, off)
+                elif total is None and len(items) >= LIST_LIMIT:
+                    submit(dir_path, offset + LIST_LIMIT)
+    client.close()
+
+    files.sort(key=lambda f: f["path"])
+    if cache_path and LIST_CACHE_MAX_AGE > 0:
+        # неполные папки в кэш не пишем — в следующий раз они будут запрошены заново
+        for d in broken:
+            dirs.pop(d, None)
+        if path in dirs:
+            try:
+                _save_list_cache(cache_path, {
+                    "public_key": public_key, "root": path,
+                    "full": old["full"] if (old and reused) else time.time(),
+                    "dirs": dirs,
+                })
+            except Exception as e:
+                if log:
+                    log(f"Кэш листинга не сохранён: {e}")
+    if log:
+        log(f"Листинг {path}: {len(files)} файлов, запросов {requests_made}, папок из кэша {reused}")
+    return files, not failed, failed